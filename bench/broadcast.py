@@ -0,0 +1,76 @@
+"""Compares the vote broadcast path of beem's TransactionBuilder with the cached-context Broadcaster.
+
+Runs offline against a local stand-in node with a fixed round trip latency:
+    python -m bench.broadcast --votes 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from beem import Hive
+from beem.transactionbuilder import TransactionBuilder
+from beembase.operations import Vote
+from beemgraphenebase.account import PrivateKey
+
+from bench.standin import StandInNode
+from utils.broadcast import Broadcaster
+from utils.nodes import NodePool
+from utils.rpc import RPCPool
+
+
+
+def vote(i: int) -> Vote:
+    return Vote(**{"voter": "curator", "author": f"author{i}", "permlink": f"post-{i}", "weight": 10000})
+
+
+def report(name: str, timings: list, calls: int, votes: int) -> None:
+    timings = sorted(timings)
+    print(f"{name:<18} mean {statistics.mean(timings) * 1000:7.1f} ms  p95 {timings[int(len(timings) * 0.95) - 1] * 1000:7.1f} ms  rpc/vote {calls / votes:.1f}")
+
+
+def legacy(node: StandInNode, wif: str, votes: int) -> None:
+    hive = Hive(node=node.url, num_retries=1)
+    node.calls.clear()
+    timings = []
+    for i in range(votes):
+        start = time.perf_counter()
+        tx = TransactionBuilder(blockchain_instance=hive)
+        tx.appendOps(vote(i))
+        tx.appendWif(wif)
+        tx.sign()
+        tx.broadcast()
+        timings.append(time.perf_counter() - start)
+    report("TransactionBuilder", timings, sum(node.calls.values()), votes)
+
+
+async def cached(node: StandInNode, wif: str, votes: int) -> None:
+    rpc = RPCPool(4, nodes=NodePool([node.url]))
+    broadcaster = Broadcaster(rpc, wif)
+    await broadcaster.refresh()
+    node.calls.clear()
+    timings = []
+    for i in range(votes):
+        start = time.perf_counter()
+        await broadcaster.broadcast([vote(i)])
+        timings.append(time.perf_counter() - start)
+    report("Broadcaster", timings, sum(node.calls.values()), votes)
+    broadcaster.close()
+    rpc.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--votes", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in node round trip in seconds")
+    args = parser.parse_args()
+    node = StandInNode(latency=args.latency).start()
+    wif = str(PrivateKey())
+    legacy(node, wif, args.votes)
+    asyncio.run(cached(node, wif, args.votes))
+    node.stop()
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Stand-ins for the few discord.py objects the bot touches, with a simulated Discord API latency"""
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import discord
+
+
+_ids = itertools.count(10 ** 17)
+
+
+
+class FakeRole:
+    def __init__(self, name: str="Curator"):
+        self.id = next(_ids)
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+
+
+class FakeMember:
+    def __init__(self, name: str, roles: list | None=None, latency: float=0.05, admin: bool=False):
+        self.id = next(_ids)
+        self.name = name
+        self.roles = list(roles or [])
+        self.latency = latency
+        self.guild_permissions = SimpleNamespace(administrator=admin)
+        self.display_avatar = SimpleNamespace(url="https://example.invalid/avatar.png")
+
+    def __str__(self) -> str:
+        return self.name
+
+
+    async def add_roles(self, *roles, reason: str | None=None) -> None:
+        await asyncio.sleep(self.latency)
+        self.roles.extend(r for r in roles if r not in self.roles)
+
+
+    async def remove_roles(self, *roles, reason: str | None=None) -> None:
+        await asyncio.sleep(self.latency)
+        self.roles = [r for r in self.roles if r not in roles]
+
+
+
+class FakeGuild:
+    """With cached off it acts like a lean gateway connection, where members are only known by fetching them"""
+    def __init__(self, role: FakeRole, members: list, cached: bool=True, latency: float=0.05):
+        self.id = next(_ids)
+        self.name = "Bench"
+        self.icon = None
+        self.cached = cached
+        self.chunked = cached
+        self.latency = latency
+        self.roles = {role.id: role}
+        self.members = {m.id: m for m in members}
+        for m in members:
+            m.guild = self
+
+
+    def get_member(self, member_id: int) -> FakeMember | None:
+        return self.members.get(member_id) if self.cached else None
+
+
+    async def fetch_member(self, member_id: int) -> FakeMember:
+        await asyncio.sleep(self.latency)
+        try:
+            return self.members[member_id]
+        except KeyError:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+
+
+    async def fetch_members(self, limit: int | None=1000):
+        members = list(self.members.values())[:limit]
+        for i, member in enumerate(members):
+            if i % 1000 == 0:
+                await asyncio.sleep(self.latency)
+            yield member
+
+
+    def get_role(self, role_id: int) -> FakeRole | None:
+        return self.roles.get(role_id)
+
+
+    async def chunk(self) -> None:
+        self.chunked = True
+
+
+
+class FakeChannel:
+    def __init__(self):
+        self.id = next(_ids)
+        self.messages = {}
+
+
+    async def fetch_message(self, message_id: int):
+        try:
+            return self.messages[message_id]
+        except KeyError:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+
+
+
+class FakeMessage:
+    """A dropped link, timing when the bot first replies to it"""
+    def __init__(self, author: FakeMember, content: str, channel: FakeChannel, guild: FakeGuild, latency: float=0.05):
+        self.id = next(_ids)
+        self.author = author
+        self.content = content
+        self.channel = channel
+        self.guild = guild
+        self.latency = latency
+        self.reactions = []
+        self.replies = []
+        self.replied = asyncio.get_running_loop().create_future()
+        channel.messages[self.id] = self
+
+
+    async def reply(self, content: str | None=None, *, embed: discord.Embed | None=None, **kwargs) -> "FakeMessage":
+        await asyncio.sleep(self.latency)
+        self.replies.append(embed.title if embed else content)
+        if not self.replied.done():
+            self.replied.set_result(asyncio.get_running_loop().time())
+        return self
+
+
+    async def add_reaction(self, emoji: str) -> None:
+        await asyncio.sleep(self.latency)
+        self.reactions.append(SimpleNamespace(emoji=emoji, me=True))
+
+
+    async def remove_reaction(self, emoji: str, member) -> None:
+        await asyncio.sleep(self.latency)
+        self.reactions = [r for r in self.reactions if r.emoji != emoji]
+
+
+
+class FakeResponse:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def edit_message(self, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+
+    async def send_message(self, *args, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+
+    async def defer(self, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+
+
+
+class FakeInteraction:
+    def __init__(self, user: FakeMember, guild: FakeGuild, latency: float=0.05):
+        self.user = user
+        self.guild = guild
+        self.latency = latency
+        self.response = FakeResponse(latency)
+
+
+    async def edit_original_response(self, **kwargs) -> None:
+        await asyncio.sleep(self.latency)
+
+
+
+class FakeBot:
+    """Just enough of a HiveDisCured tenant for its Curation engine and curation queue to run against"""
+    def __init__(self, config: dict, guild: FakeGuild, role: FakeRole, channel: FakeChannel, rpc, db, metrics, tokens):
+        self.config = config
+        self.guild_id = guild.id
+        self.role_id = role.id
+        self.chan_id = channel.id
+        self.guild = guild
+        self.channel = channel
+        self.rpc = rpc
+        self.db = db
+        self.metrics = metrics
+        self.tokens = tokens
+        self.labels = {}
+        self.curation = None
+        self.members = None
+        self.accounts = None
+        self.color = discord.Colour.dark_gold()
+        self.user = FakeMember("HiveDisCured")
+        self.loop = asyncio.get_running_loop()
+
+
+    def get_guild(self, guild_id: int) -> FakeGuild | None:
+        return self.guild if guild_id == self.guild_id else None
+
+
+    def get_channel(self, channel_id: int) -> FakeChannel | None:
+        return self.channel if channel_id == self.chan_id else None
+
+
+    def path(self, name: str) -> str:
+        return name
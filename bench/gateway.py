@@ -0,0 +1,123 @@
+"""Measures what discord.py's gateway caches cost for a large guild, with and without LEAN_GATEWAY.
+
+Feeds a synthetic GUILD_CREATE and the member chunks Discord would send into a
+real discord.py connection state, so no Discord connection is needed:
+    python -m bench.gateway --members 40000 --online 0.3
+
+Each mode runs in its own process, and memory is the resident set growth
+from building the caches.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import subprocess
+import sys
+import time
+
+import discord
+from discord.user import ClientUser
+
+from main import gateway_options
+
+
+GUILD_ID = 900000000000000000
+BOT_ID = 910000000000000000
+ROLE_ID = 920000000000000000
+CHUNK = 1000
+
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * 4096 / 1024 / 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def user(i: int) -> dict:
+    return {"id": str(BOT_ID + 1 + i), "username": f"member{i}", "global_name": f"Member {i}", "discriminator": "0", "avatar": f"{i:032x}"}
+
+
+def member(i: int) -> dict:
+    return {"user": user(i), "roles": [str(ROLE_ID)] if i % 3 == 0 else [], "joined_at": "2023-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+
+
+def presence(i: int) -> dict:
+    return {
+        "user": {"id": str(BOT_ID + 1 + i)}, "status": "online", "client_status": {"desktop": "online"},
+        "activities": [{"name": "Hive", "type": 0, "created_at": 1700000000000, "timestamps": {"start": 1700000000000}}],
+    }
+
+
+def guild() -> dict:
+    bot = {"user": {"id": str(BOT_ID), "username": "HiveDisCured", "discriminator": "0", "avatar": None, "bot": True}, "roles": [], "joined_at": "2023-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+    return {
+        "id": str(GUILD_ID), "name": "Bench", "owner_id": str(BOT_ID), "large": True, "member_count": 0,
+        "roles": [
+            {"id": str(GUILD_ID), "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False},
+            {"id": str(ROLE_ID), "name": "Curator", "permissions": "0", "position": 1, "color": 0, "hoist": False, "managed": False, "mentionable": False},
+        ],
+        "channels": [{"id": str(GUILD_ID + 1), "type": 0, "name": "curation-station", "position": 0, "permission_overwrites": []}],
+        "members": [bot], "presences": [], "emojis": [], "stickers": [], "threads": [], "stage_instances": [], "guild_scheduled_events": [],
+        "features": [], "voice_states": [],
+    }
+
+
+async def measure(lean: bool, members: int, online: float) -> dict:
+    client = discord.Client(**gateway_options(lean))
+    state = client._connection
+    state.user = ClientUser(state=state, data={"id": str(BOT_ID), "username": "HiveDisCured", "discriminator": "0", "avatar": None, "bot": True})
+    gc.collect()
+    before, start = rss_mb(), time.perf_counter()
+    data = guild()
+    data["member_count"] = members
+    g = state._add_guild_from_data(data)
+    chunks = 0
+    if state._guild_needs_chunking(g):
+        # What a startup chunk request brings in, one GUILD_MEMBERS_CHUNK event at a time
+        count = -(-members // CHUNK)
+        for index in range(count):
+            ids = range(index * CHUNK, min((index + 1) * CHUNK, members))
+            chunk = [discord.Member(guild=g, data=member(i), state=state) for i in ids]
+            if state._intents.presences:
+                for m, i in zip(chunk, ids):
+                    if (i * 7919) % 100 < online * 100:
+                        m._presence_update(presence(i), presence(i)["user"])
+            for m in chunk:
+                g._add_member(m)
+            chunks += 1
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    return {
+        "mode": "lean" if lean else "full",
+        "intents": state._intents.value,
+        "cached_members": len(g.members),
+        "chunk_events": chunks,
+        "cache_build_s": round(elapsed, 2),
+        "rss_growth_mb": round(rss_mb() - before, 1),
+        "rss_mb": round(rss_mb(), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=40000)
+    parser.add_argument("--online", type=float, default=0.3, help="Share of members online with an activity")
+    parser.add_argument("--mode", choices=("full", "lean", "both"), default="both")
+    args = parser.parse_args()
+    if args.mode != "both":
+        print(json.dumps(asyncio.run(measure(args.mode == "lean", args.members, args.online))))
+        return
+    print(f"{'mode':<6}{'intents':>10}{'members':>10}{'chunks':>8}{'build s':>9}{'cache MB':>10}{'RSS MB':>9}")
+    for mode in ("full", "lean"):
+        cmd = [sys.executable, "-m", "bench.gateway", "--members", str(args.members), "--online", str(args.online), "--mode", mode]
+        r = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+        print(f"{r['mode']:<6}{r['intents']:>10}{r['cached_members']:>10}{r['chunk_events']:>8}{r['cache_build_s']:>9}{r['rss_growth_mb']:>10}{r['rss_mb']:>9}")
+
+
+
+if __name__ == "__main__":
+    main()
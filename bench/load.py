@@ -0,0 +1,318 @@
+"""Offline load test of the curation pipeline against a local stand-in Hive node and fake Discord objects.
+
+Each scenario runs in its own process so its peak RSS is its own:
+    python -m bench.load
+    python -m bench.load --scenario curate --links 1000 --rate 20
+    python -m bench.load --scenario curate --per-message 5
+    python -m bench.load --budget bench/budget.json
+
+With --budget the run fails when a scenario's p95 latency or peak RSS goes over
+the limits in that file, which is how CI catches performance regressions.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from bench.fakes import FakeBot, FakeChannel, FakeGuild, FakeInteraction, FakeMember, FakeMessage, FakeRole
+from bench.standin import StandInNode
+
+
+SCENARIOS = ("get_holders", "update_roles", "verify", "curate")
+ACC_NAME = "curator"
+TOKEN = "BENCH"
+MIN_TOKENS = 10
+
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def summary(name: str, timings: list, elapsed: float, items: int, calls: int) -> dict:
+    timings = sorted(timings)
+    cuts = statistics.quantiles(timings, n=100, method="inclusive") if len(timings) > 1 else timings * 99
+    return {
+        "scenario": name,
+        "samples": len(timings),
+        "p50_ms": round(cuts[49] * 1000, 1),
+        "p95_ms": round(cuts[94] * 1000, 1),
+        "p99_ms": round(cuts[98] * 1000, 1),
+        "throughput": round(items / elapsed, 1) if elapsed else 0.0,
+        "rpc_calls": calls,
+        "peak_rss_mb": round(peak_rss_mb() or 0, 1),
+    }
+
+
+
+class Environment:
+    """A Curation engine wired to a stand-in node, fake guild and a throwaway working directory"""
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+
+
+    async def __aenter__(self) -> "Environment":
+        # Imported here so the bot's modules are measured as part of the scenario's memory
+        from cogs.commands import Curation
+        from utils.jobs import CurationQueue
+        from utils.members import MemberCache
+        from utils.metrics import Metrics
+        from utils.nodes import NodePool
+        from utils.rpc import RPCPool
+        from utils.store import LinkStore
+        from utils.tenants import TokenFeeds
+        from beemgraphenebase.account import PrivateKey
+
+        args = self.args
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        random.seed(args.seed)
+
+        self.node = StandInNode(latency=args.latency, failure_rate=args.failure_rate).start()
+        self.node.add_holders(TOKEN, {f"holder{i}": (0.0, float(i % 100) + 0.5) for i in range(args.holders)})
+        self.role = FakeRole()
+        self.members = [FakeMember(f"member{i}", latency=args.discord_latency) for i in range(args.members)]
+        self.guild = FakeGuild(self.role, self.members, cached=not args.lean, latency=args.discord_latency)
+        self.channel = FakeChannel()
+        self.metrics = Metrics()
+        self.nodes = NodePool([self.node.url], workers=args.rpc_workers, metrics=self.metrics)
+        self.rpc = RPCPool(args.rpc_workers, nodes=self.nodes)
+        self.db = LinkStore()
+        for i, member in enumerate(self.members):
+            self.db[str(member.id)] = f"holder{i}"
+        config = {
+            "ACC_NAME": ACC_NAME, "ACC_WIF": str(PrivateKey()), "TOKEN_NAME": TOKEN, "TOKEN_TYPE": "stake",
+            "MIN_TOKENS": MIN_TOKENS, "VOTE_PCT": 1.0, "POST_TAG": "bench", "VOTE_COMMENTS": False, "CUR_WINDOW": 24,
+            "ENGINE_API": f"{self.node.url}/engine/", "ROLE_CONCURRENCY": args.role_concurrency,
+            "VOTE_BATCH_WINDOW": args.batch_window, "BROADCAST_RETRIES": 1,
+        }
+        self.bot = FakeBot(config, self.guild, self.role, self.channel, self.rpc, self.db, self.metrics, TokenFeeds(self.rpc, metrics=self.metrics))
+        if args.lean:
+            self.bot.members = MemberCache()
+        self.engine = Curation(self.bot)
+        self.bot.curation = CurationQueue(self.bot, self.engine.curate, workers=args.workers, max_pending=args.links + 1, metrics=self.metrics)
+        return self
+
+
+    async def __aexit__(self, *exc) -> None:
+        self.engine.votes.flush()
+        await asyncio.gather(*self.engine.votes.sending, return_exceptions=True)
+        await self.bot.curation.close(0)
+        self.engine.broadcaster.close()
+        self.rpc.close()
+        self.db.close()
+        self.node.stop()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+
+    def calls(self) -> int:
+        # HTTP round trips to the node, a batched request counts once
+        return self.node.requests
+
+
+
+async def get_holders(env: Environment) -> dict:
+    """Full holder list refreshes, paging through every holder of the token"""
+    timings, start = [], time.perf_counter()
+    env.node.reset()
+    for _ in range(env.args.repeat):
+        env.engine.holders.updated = 0.0
+        t = time.perf_counter()
+        await env.engine.get_holders()
+        timings.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    return summary("get_holders", timings, elapsed, len(env.engine.holders.balances) * env.args.repeat, env.calls())
+
+
+async def update_roles(env: Environment) -> dict:
+    """Daily role reconciles, with a share of the linked members needing their role changed each run"""
+    await env.engine.get_holders()
+    timings, changes, start = [], 0, None
+    env.node.reset()
+    for _ in range(env.args.repeat):
+        for i, member in enumerate(env.members):
+            eligible = (i % 100) + 0.5 >= MIN_TOKENS
+            # Members start with the right role, except for the churned share
+            has_role = eligible != (random.random() < env.args.churn)
+            member.roles = [env.role] if has_role else []
+        start = start or time.perf_counter()
+        t = time.perf_counter()
+        stats = await env.engine.update_roles()
+        timings.append(time.perf_counter() - t)
+        changes += stats.added + stats.removed
+    elapsed = time.perf_counter() - start
+    return summary("update_roles", timings, elapsed, changes, env.calls())
+
+
+async def verify(env: Environment) -> dict:
+    """Verify clicks from users who already sent their memo transfer, arriving at --verify-rate a second"""
+    from cogs.commands import BotView
+    from types import SimpleNamespace
+
+    await env.engine.get_holders()
+    users = [FakeMember(f"verifier{i}", latency=env.args.discord_latency) for i in range(env.args.verifies)]
+    for i, user in enumerate(users):
+        env.node.add_transfer(f"holder{env.args.members + i}", ACC_NAME, base64.b64encode(str(user.id).encode()).decode())
+        env.guild.members[user.id] = user
+    env.node.reset()
+
+    async def click(user: FakeMember, acc: str) -> float:
+        ctx = SimpleNamespace(guild=env.guild, author=user)
+        view = BotView(ctx, SimpleNamespace(name=acc), env.engine)
+        t = time.perf_counter()
+        await view.verify(FakeInteraction(user, env.guild, env.args.discord_latency))
+        return time.perf_counter() - t
+
+    start, tasks = time.perf_counter(), []
+    for i, user in enumerate(users):
+        tasks.append(asyncio.create_task(click(user, f"holder{env.args.members + i}")))
+        await asyncio.sleep(random.expovariate(env.args.verify_rate))
+    timings = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    verified = sum(1 for u in users if str(u.id) in env.db)
+    if verified != len(users):
+        print(f"verify: only {verified} of {len(users)} users were verified", file=sys.stderr)
+    return summary("verify", timings, elapsed, verified, env.calls())
+
+
+def link(i: int) -> str:
+    """A dropped link, mostly good posts with some of each kind the bot turns away"""
+    roll = random.random()
+    if roll < 0.05:
+        return f"https://peakd.com/hive-123/@author{i}/post-{i}-old"
+    if roll < 0.10:
+        return f"https://peakd.com/hive-123/@author{i}/post-{i}-notag"
+    if roll < 0.13:
+        return f"https://peakd.com/hive-123/@author{i}/post-{i}-comment"
+    if roll < 0.15:
+        return f"https://peakd.com/hive-123/@author{i}/post-{i}-missing"
+    if roll < 0.20 and i:
+        # The same post dropped again by a different curator
+        j = random.randrange(i)
+        return f"https://peakd.com/hive-123/@author{j}/post-{j}"
+    return f"https://peakd.com/hive-123/@author{i}/post-{i}"
+
+
+async def curate(env: Environment) -> dict:
+    """Messages of --per-message links dropped at --rate links a second through the durable queue, timed from drop to the bot's reply"""
+    await env.engine.get_holders()
+    await env.engine.broadcaster.refresh()
+    env.bot.curation.start()
+    curators = [m for i, m in enumerate(env.members) if (i % 100) + 0.5 >= MIN_TOKENS][:500]
+    env.node.reset()
+    loop = asyncio.get_running_loop()
+    messages, dropped = [], {}
+    start = time.perf_counter()
+    per_message = max(env.args.per_message, 1)
+    for i in range(0, env.args.links, per_message):
+        content = " ".join(link(j) for j in range(i, min(i + per_message, env.args.links)))
+        message = FakeMessage(random.choice(curators), content, env.channel, env.guild, env.args.discord_latency)
+        dropped[message.id] = loop.time()
+        await env.bot.curation.put(message)
+        messages.append(message)
+        await asyncio.sleep(random.expovariate(env.args.rate / per_message))
+    replied = await asyncio.gather(*(m.replied for m in messages))
+    elapsed = time.perf_counter() - start
+    timings = [at - dropped[m.id] for m, at in zip(messages, replied)]
+    return summary("curate", timings, elapsed, env.args.links, env.calls())
+
+
+async def run(name: str, args: argparse.Namespace) -> dict:
+    async with Environment(args) as env:
+        return await globals()[name](env)
+
+
+
+def table(results: list) -> str:
+    lines = [f"{'scenario':<14}{'samples':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'items/s':>10}{'rpc':>8}{'rss MB':>9}"]
+    for r in results:
+        lines.append(
+            f"{r['scenario']:<14}{r['samples']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+            f"{r['throughput']:>10}{r['rpc_calls']:>8}{r['peak_rss_mb']:>9}"
+        )
+    return "\n".join(lines)
+
+
+def over_budget(results: list, path: str) -> list:
+    with open(path, "r") as f:
+        budget = json.load(f)
+    failures = []
+    for r in results:
+        limits = budget.get(r["scenario"], {})
+        for key in ("p95_ms", "p99_ms", "peak_rss_mb"):
+            if key in limits and r[key] > limits[key]:
+                failures.append(f"{r['scenario']} {key} {r[key]} is over the budget of {limits[key]}")
+        if "min_throughput" in limits and r["throughput"] < limits["min_throughput"]:
+            failures.append(f"{r['scenario']} throughput {r['throughput']} is under the budget of {limits['min_throughput']}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--links", type=int, default=300, help="Links dropped in the curate scenario")
+    parser.add_argument("--rate", type=float, default=1.5, help="Links dropped a second, over five times a busy hour of 1k links")
+    parser.add_argument("--per-message", type=int, default=1, help="Links in each dropped message of the curate scenario")
+    parser.add_argument("--holders", type=int, default=50000, help="Token holders on the stand-in Hive-Engine")
+    parser.add_argument("--members", type=int, default=10000, help="Linked guild members")
+    parser.add_argument("--verifies", type=int, default=300, help="Verify clicks in the verify scenario")
+    parser.add_argument("--verify-rate", type=float, default=20, help="Verify clicks a second")
+    parser.add_argument("--churn", type=float, default=0.05, help="Share of members whose role must change per reconcile")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the get_holders and update_roles scenarios")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in node round trip in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of stand-in node requests that fail")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="Simulated Discord API round trip in seconds")
+    parser.add_argument("--rpc-workers", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4, help="Curation queue workers")
+    parser.add_argument("--role-concurrency", type=int, default=5)
+    parser.add_argument("--batch-window", type=float, default=2.0, help="Vote batching window in seconds")
+    parser.add_argument("--lean", action="store_true", help="Run as with LEAN_GATEWAY, without a member cache")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    parser.add_argument("--budget", help="JSON file of per-scenario limits, exits non-zero when one is exceeded")
+    args = parser.parse_args()
+
+    if args.scenario != "all":
+        results = [asyncio.run(run(args.scenario, args))]
+    else:
+        # A fresh process per scenario, so peak RSS belongs to that scenario alone
+        results = []
+        forwarded = [a for a in sys.argv[1:] if a != "--json"]
+        for name in SCENARIOS:
+            cmd = [sys.executable, "-m", "bench.load", *forwarded, "--scenario", name, "--json"]
+            out = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    if args.json:
+        for r in results:
+            print(json.dumps(r))
+    else:
+        print(table(results))
+    if args.budget and not args.json:
+        failures = over_budget(results, args.budget)
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+
+if __name__ == "__main__":
+    main()
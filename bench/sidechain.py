@@ -0,0 +1,126 @@
+"""Replays recorded Hive-Engine sidechain blocks through the sidechain follower, offline.
+
+Checks that every block touches the expected accounts, that following them
+in small steps sees the same accounts, and that the checkpoint only moves on
+once the touched balances were re-read:
+    python -m bench.sidechain
+    python -m bench.sidechain --blocks recorded.json --step 2
+
+The blocks file holds {"symbol", "blocks", "touched"}, with the blocks as the
+sidechain's getBlockInfo returns them and the accounts each one should touch.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+from utils.rpc import RPCPool
+from utils.sidechain import SidechainFollower, touched_accounts
+from utils.tenants import TokenFeed
+
+
+BLOCKS = os.path.join(os.path.dirname(__file__), "sidechain_blocks.json")
+
+
+
+class RecordedBlocks:
+    """Stands in for EngineBlocks with a list of recorded blocks, of which only those up to head are out yet"""
+    def __init__(self, blocks: list):
+        self.blocks = {block['blockNumber']: block for block in blocks}
+        self.first = min(self.blocks)
+        self.head = self.first - 1
+
+
+    def latest(self) -> int:
+        return self.head
+
+
+    def block(self, number: int) -> dict | None:
+        return self.blocks.get(number) if number <= self.head else None
+
+
+
+class FlakyHolders:
+    """A holder index whose balance reads fail the first `failures` times"""
+    def __init__(self, failures: int=0):
+        self.failures = failures
+        self.seen = set()
+
+
+    async def update_accounts(self, accounts) -> dict:
+        if not accounts:
+            return {}
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Hive-Engine node unavailable")
+        self.seen |= set(accounts)
+        return {acc: (0.0, 1.0) for acc in accounts}
+
+
+
+def check(name: str, ok: bool, detail: str="") -> bool:
+    print(f"{'ok' if ok else 'FAIL':<6}{name}" + (f"  {detail}" if detail and not ok else ""))
+    return ok
+
+
+async def run(recording: dict, step: int, folder: str) -> bool:
+    symbol, blocks = recording['symbol'], recording['blocks']
+    expected = {int(k): set(v) for k, v in recording['touched'].items()}
+    passed = True
+    for block in blocks:
+        touched = touched_accounts(block, symbol)
+        passed &= check(f"block {block['blockNumber']} touches {sorted(touched)}", touched == expected[block['blockNumber']], f"expected {sorted(expected[block['blockNumber']])}")
+
+    rpc = RPCPool(2)
+    source = RecordedBlocks(blocks)
+    path = os.path.join(folder, "sidechain.json")
+    follower = SidechainFollower(rpc, source, symbol, path=path, max_blocks=step)
+    # The first poll starts from the head it finds, like a bot that never followed this token before
+    accounts, last = await follower.poll()
+    await follower.commit(last)
+    seen = set()
+    source.head = max(source.blocks)
+    while follower.checkpoint < source.head:
+        accounts, last = await follower.poll()
+        seen |= accounts
+        await follower.commit(last)
+    everything = set().union(*expected.values())
+    passed &= check(f"follows {len(blocks)} blocks in steps of {step}", seen == everything, f"saw {sorted(seen)}")
+    passed &= check("resumes from the saved checkpoint", SidechainFollower(rpc, source, symbol, path=path).checkpoint == source.head)
+
+    os.remove(path)
+    source.head = source.first - 1
+    follower = SidechainFollower(rpc, source, symbol, path=path, max_blocks=len(blocks))
+    holders = FlakyHolders(failures=1)
+    feed = TokenFeed(holders, follower, min_interval=0)
+    await feed.poll(object())
+    source.head = max(source.blocks)
+    try:
+        await feed.poll(object())
+        failed = False
+    except ConnectionError:
+        failed = True
+    passed &= check("checkpoint stays put when the balance read fails", failed and follower.checkpoint == source.first - 1)
+    await feed.poll(object())
+    passed &= check("the next poll re-reads the same accounts", holders.seen == everything, f"re-read {sorted(holders.seen)}")
+    rpc.close()
+    return passed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", default=BLOCKS, help="JSON file of recorded sidechain blocks and the accounts they touch")
+    parser.add_argument("--step", type=int, default=1, help="Blocks the follower reads per poll")
+    args = parser.parse_args()
+    with open(args.blocks, "r") as f:
+        recording = json.load(f)
+    with tempfile.TemporaryDirectory() as folder:
+        passed = asyncio.run(run(recording, args.step, folder))
+    sys.exit(0 if passed else 1)
+
+
+
+if __name__ == "__main__":
+    main()
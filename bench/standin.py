@@ -0,0 +1,173 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+
+class StandInNode:
+    """Local JSON-RPC server that answers the Hive and Hive-Engine API calls the bot makes,
+    with configurable latency and failures.
+
+    Posts are made up from their permlink: one ending in -old is older than any
+    curation window, -notag has no tags, -comment is a reply and -missing doesn't exist.
+    Token holders and transfers to accounts are added with add_holders() and add_transfer().
+    """
+    def __init__(self, latency: float=0.05, failure_rate: float=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = Counter()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.head = 90000000
+        self.holders = {}
+        self.history = {}
+        self.handlers = {
+            "get_config": lambda params: {},
+            "get_dynamic_global_properties": self.dynamic_global_properties,
+            "get_block_header": self.block_header,
+            "broadcast_transaction": lambda params: {},
+            "get_post": lambda params: self.post(params["author"], params["permlink"]),
+            "get_content": lambda params: self.post(*params[:2]),
+            "get_account_history": self.account_history,
+            # Hive-Engine contracts endpoint
+            "find": self.find,
+        }
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                # A batch costs one round trip, like it would on a real node
+                with node.lock:
+                    node.requests += 1
+                time.sleep(node.latency)
+                reply = [node.handle(x) for x in body] if isinstance(body, list) else node.handle(body)
+                out = json.dumps(reply).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+
+    def start(self) -> "StandInNode":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+    def reset(self) -> None:
+        """Zeroes the call counts"""
+        self.calls.clear()
+        with self.lock:
+            self.requests = 0
+
+
+    def handle(self, request: dict) -> dict:
+        method, params = request["method"].split(".")[-1], request.get("params")
+        if method == "call":
+            # Old style ["api", "method", [args]] calls
+            method, params = params[1], params[2]
+        self.calls[method] += 1
+        if random.random() < self.failure_rate:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": -32000, "message": "stand-in failure"}}
+        handler = self.handlers.get(method)
+        if handler is None:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": -32601, "message": f"{method} not served"}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": handler(params)}
+
+
+    def add_holders(self, symbol: str, holders: dict) -> None:
+        """Sets every holder of a token, as {account: (balance, stake)}"""
+        self.holders[symbol] = [
+            {"account": acc, "symbol": symbol, "balance": f"{balance:.8f}", "stake": f"{stake:.8f}"}
+            for acc, (balance, stake) in holders.items()
+        ]
+
+
+    def add_transfer(self, sender: str, to: str, memo: str, amount: str="0.001 HIVE") -> None:
+        history = self.history.setdefault(to, [])
+        history.append([len(history), {
+            "trx_id": f"{len(history):040x}",
+            "block": self.head,
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+            "op": {"type": "transfer_operation", "value": {"from": sender, "to": to, "amount": amount, "memo": memo}},
+        }])
+
+
+    def post(self, author: str, permlink: str) -> dict | None:
+        if permlink.endswith("-missing"):
+            return None
+        created = datetime.now(timezone.utc) - timedelta(days=3 if permlink.endswith("-old") else 0, hours=1)
+        comment = permlink.endswith("-comment")
+        tags = [] if permlink.endswith("-notag") else ["hive", "bench"]
+        return {
+            "author": author, "permlink": permlink, "title": f"Post {permlink}",
+            "body": "Lorem ipsum " * 100, "category": "hive-123",
+            "parent_author": "someone" if comment else "", "parent_permlink": "parent" if comment else "hive-123",
+            "depth": 1 if comment else 0,
+            "json_metadata": {"tags": tags, "image": ["https://example.invalid/image.png"], "app": "peakd/2024"},
+            "created": created.strftime("%Y-%m-%dT%H:%M:%S"),
+            "updated": created.strftime("%Y-%m-%dT%H:%M:%S"),
+            "payout_at": (created + timedelta(days=7)).strftime("%Y-%m-%dT%H:%M:%S"),
+            "pending_payout_value": "1.234 HBD", "author_payout_value": "0.000 HBD",
+            "curator_payout_value": "0.000 HBD", "promoted": "0.000 HBD",
+            "net_rshares": 0, "author_reputation": 60, "stats": {"total_votes": 0}, "active_votes": [],
+            "children": 0, "replies": [], "url": f"/hive-123/@{author}/{permlink}",
+        }
+
+
+    def account_history(self, params) -> dict:
+        account, start, limit = (params["account"], params["start"], params["limit"]) if isinstance(params, dict) else params[:3]
+        history = self.history.get(account, [])
+        if start < 0:
+            start = len(history) - 1
+        return {"history": history[max(start - limit + 1, 0):start + 1]}
+
+
+    def find(self, params: dict) -> list:
+        if params["contract"] != "tokens" or params["table"] != "balances":
+            return []
+        query = params.get("query", {})
+        rows = self.holders.get(query.get("symbol"), [])
+        if "account" in query:
+            accounts = set(query["account"]["$in"]) if isinstance(query["account"], dict) else {query["account"]}
+            rows = [x for x in rows if x["account"] in accounts]
+        offset = params.get("offset", 0)
+        return rows[offset:offset + params.get("limit", 1000)]
+
+
+    def dynamic_global_properties(self, params) -> dict:
+        self.head += 1
+        return {
+            "head_block_number": self.head,
+            "head_block_id": f"{self.head:08x}" + "ab" * 16,
+            "last_irreversible_block_num": self.head - 20,
+            "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+
+    def block_header(self, params) -> dict:
+        number = params["block_num"] if isinstance(params, dict) else params[0]
+        header = {"previous": f"{number - 1:08x}" + "cd" * 16, "timestamp": "2024-01-01T00:00:00", "witness": "standin"}
+        return {"header": header} if isinstance(params, dict) else header
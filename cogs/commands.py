@@ -1,31 +1,48 @@
 import asyncio
 import discord
 import base64
-import json
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
 from discord.ext import commands, tasks
 from discord import app_commands
 
-from beem import Hive
-from beem.account import Account
-from beem.comment import Comment
-from beem.transactionbuilder import TransactionBuilder
-from beembase.operations import Vote
-from hiveengine.api import Api
-from hiveengine.tokenobject import Token
-from hiveengine.wallet import Wallet
 from typing import Union
+from utils.broadcast import Broadcaster, already_applied
+from utils.mana import HeldVotes, ManaTracker
+from utils.history import CurationHistory, ranked
+from utils.nodes import node_errors
+from utils.ledger import VoteLedger
+from utils.posts import PostCache, find_links
+from utils.roles import reconcile_roles
+from utils.transfers import TransferWatcher
+from utils.votes import VoteBatcher
 
 
 
-async def HiveAcc(name) -> object:
+def _load_account(hive, name) -> object:
+    from beem.account import Account
     try:
-        acc = Account(name, blockchain_instance=Hive())
+        acc = Account(name, blockchain_instance=hive)
     except Exception:
         acc = {}
     return acc
 
 
+async def HiveAcc(bot: commands.Bot, name) -> object:
+    return await bot.rpc.hive(_load_account, name)
+
+
+# Periods the history commands can count over, in days with 0 for all time
+PERIODS = [
+    app_commands.Choice(name="Last 7 days", value=7),
+    app_commands.Choice(name="Last 30 days", value=30),
+    app_commands.Choice(name="Last 90 days", value=90),
+    app_commands.Choice(name="All time", value=0),
+]
+# Discord turns away an embed whose description is any longer
+DESCRIPTION_LIMIT = 4096
+
+
 class Button(discord.ui.Button):
     def __init__(
         self, ctx: Union[commands.Context, discord.Interaction],
@@ -47,10 +64,12 @@ class Button(discord.ui.Button):
 
 
 class BotView(discord.ui.View):
-    def __init__(self, ctx: Union[commands.Context, discord.Interaction], acc: HiveAcc, timeout=666):
+    def __init__(self, ctx: Union[commands.Context, discord.Interaction], acc: HiveAcc, engine: "Curation", timeout=666):
         super().__init__(timeout=timeout)
         self.ctx = ctx
         self.acc = acc
+        self.engine = engine
+        self.bot = engine.bot
         self.message = None
         self.embed = self.gen_embed()
         self.gen_buttons()
@@ -58,14 +77,14 @@ class BotView(discord.ui.View):
 
 
     def gen_embed(self) -> discord.Embed:
-        embed = discord.Embed(color=self.ctx.bot.color, timestamp=discord.utils.utcnow())
+        embed = discord.Embed(color=self.bot.color, timestamp=discord.utils.utcnow())
         try:
             profurl = self.acc.posting_json_metadata.get("profile", {}).get("profile_image", self.ctx.guild.icon)
         except Exception:
             profurl = self.ctx.guild.icon
         embed.set_thumbnail(url=profurl)
-        embed.set_footer(text=f"{self.ctx.bot.user.name} - Developed by @yaziris", icon_url=self.ctx.bot.user.display_avatar.url)
-        embed.set_author(name=f"@{self.ctx.bot.user.name}", icon_url=profurl or self.ctx.guild.icon)
+        embed.set_footer(text=f"{self.bot.user.name} - Developed by @yaziris", icon_url=self.bot.user.display_avatar.url)
+        embed.set_author(name=f"@{self.bot.user.name}", icon_url=profurl or self.ctx.guild.icon)
         return embed
 
     
@@ -105,19 +124,13 @@ class BotView(discord.ui.View):
 
 
     async def verify_acc(self, memo: str) -> bool:
-        stop_time = discord.utils.utcnow() - timedelta(minutes=10)
-        for op in self.acc.history_reverse(stop=stop_time, use_block_num=False, only_ops=['transfer']):
-            if op['to'] == self.ctx.bot.config['ACC_NAME'] and op['memo'] == memo:
-                return True
-        return False
+        with self.bot.metrics.timer("verify_seconds", **self.bot.labels):
+            return await self.engine.transfers.verify(memo, self.acc.name)
 
 
     async def verify_tokens(self) -> bool:
-        wallet = Wallet(self.acc.name, blockchain_instance=Hive())
-        tokens = wallet.get_token(self.ctx.bot.config['TOKEN_NAME'])
-        if tokens and float(tokens.get(self.bot.config['TOKEN_TYPE'], 0)) >= self.ctx.bot.config['MIN_TOKENS']:
-            return True
-        return False
+        balance = await self.engine.get_balance(self.acc.name)
+        return balance >= self.bot.config['MIN_TOKENS']
 
 
     async def verify(self, interaction: discord.Interaction):
@@ -128,24 +141,22 @@ class BotView(discord.ui.View):
         await interaction.response.edit_message(embed=self.embed, view=self)
         self.clear_items()
         if await self.verify_acc(base64.b64encode(str(interaction.user.id).encode()).decode()):
-            self.ctx.bot.db[str(interaction.user.id)] = self.acc.name
-            with open("db.json", "w") as f:
-                json.dump(self.ctx.bot.db, f, indent=4)
+            self.bot.db[str(interaction.user.id)] = self.acc.name
             self.embed.title = "✅ Verified!"
             self.embed.description = f"> **@{self.acc.name}** has been succesfully linked!\n\n"
             self.add_item(self.verifiedB)
             # check token amount to grant or remove the role
-            role = interaction.guild.get_role(self.ctx.bot.role_id)
+            role = interaction.guild.get_role(self.bot.role_id)
             if await self.verify_tokens():
                 if role not in interaction.user.roles:
                     await interaction.user.add_roles(role)
-                    self.embed.description += f"\n>>> You hold sufficient tokens amount of **{self.ctx.bot.config['TOKEN_NAME']}** and have been granted access to the <#{self.ctx.bot.chan_id}> channel!"
+                    self.embed.description += f"\n>>> You hold sufficient tokens amount of **{self.bot.config['TOKEN_NAME']}** and have been granted access to the <#{self.bot.chan_id}> channel!"
             else:
                 if role in interaction.user.roles:
                     await interaction.user.remove_roles(role)
         else:
             self.embed.title = "\n\n ❌❌⛔ Unverified ⛔❌❌"
-            self.embed.description = f"Couldn't link Hive account **@{self.acc.name}**. Make sure you already sent the transaction with the provided memo from it to **[@{self.ctx.bot.config['ACC_NAME']}](https://peakd.com/@{self.ctx.bot.config['ACC_NAME']})** then try registering again!"
+            self.embed.description = f"Couldn't link Hive account **@{self.acc.name}**. Make sure you already sent the transaction with the provided memo from it to **[@{self.bot.config['ACC_NAME']}](https://peakd.com/@{self.bot.config['ACC_NAME']})** then try registering again!"
             self.add_item(self.unverifiedB)
         await interaction.edit_original_response(embed=self.embed, view=self)
         return self.stop()
@@ -156,7 +167,7 @@ class BotView(discord.ui.View):
         self.add_item(self.cancelB)
         self.embed.add_field(
                 name=f"🔐 To link @{self.acc.name} with your discord user:",
-                value=f">>> Send a tiny amount of hive or hbd from @{self.acc.name}, to **[@{self.ctx.bot.config['ACC_NAME']}](https://peakd.com/@{self.ctx.bot.config['ACC_NAME']})** WITH ONLY the following in the memo:", inline=False)
+                value=f">>> Send a tiny amount of hive or hbd from @{self.acc.name}, to **[@{self.bot.config['ACC_NAME']}](https://peakd.com/@{self.bot.config['ACC_NAME']})** WITH ONLY the following in the memo:", inline=False)
         self.embed.add_field(
                 name=base64.b64encode(str(interaction.user.id).encode()).decode(),
                 value="\n>>> This is very important to verify your authority over that Hive account.\n\nOnce you've sent the transaction, click the __**Verify**__ ✅ button, and your account will be linked.", inline=False)
@@ -166,16 +177,67 @@ class BotView(discord.ui.View):
 
 
 
-class Commands(commands.Cog, name="Commands"):
-    """The bot's commands"""
-    def __init__(self, bot: commands.Bot):
+class Curation:
+    """One curation project's voting, holder roles and commands, run against its Tenant as the bot"""
+    def __init__(self, bot):
         self.bot = bot
-        self.hive = Hive()
-        self.wallet = Wallet(self.bot.config['ACC_NAME'], blockchain_instance=self.hive)
+        # Projects curating with the same token share its holder index and sidechain follower
+        self.feed = self.bot.tokens.get(self.bot.config)
+        self.holders = self.feed.holders
+        self.sidechain = self.feed.sidechain
+        self.api = self.holders.api
+        self.ledger = VoteLedger(self.bot.path("votes.log"))
+        self.history = CurationHistory(self.bot.path("curation.log"), self.bot.config.get("HISTORY_DAYS", 90))
+        self.pending = {}
+        self.backfill_task = None
+        self.posts = PostCache(self.bot.rpc, ttl=self.bot.config.get("POST_CACHE_TTL", 60))
+        self.transfers = TransferWatcher(self.bot.rpc, self.bot.config['ACC_NAME'])
+        self.mana = ManaTracker(self.bot.rpc, self.bot.config['ACC_NAME'], self.bot.config.get("MANA_REFRESH", 300))
+        self.held = HeldVotes()
+        self.broadcaster = Broadcaster(self.bot.rpc, self.bot.config['ACC_WIF'])
+        self.votes = VoteBatcher(self._broadcast_tx, self.bot.config.get("VOTE_BATCH_WINDOW", 2.0), self.bot.config.get("VOTE_BATCH_MAX", 10))
+        self.metrics = self.bot.metrics
+        self.metrics.gauge("held_votes", lambda: len(self.held), **self.bot.labels)
+        self.metrics.gauge("token_holders", lambda: len(self.holders.balances), **self.bot.labels)
+        self.metrics.gauge("voting_mana_pct", lambda: round(self.mana.projected(), 2), **self.bot.labels)
+
+
+    async def start(self):
+        self.chain_context.start()
+        self.transfer_watch.start()
+        if self.bot.config.get("VOTE_MANA_FLOOR", 0):
+            self.mana_release.start()
+        self.backfill_task = self.bot.loop.create_task(self.backfill_votes())
+
+
+    async def backfill_votes(self):
+        await self.bot.wait_until_ready()
+        delay = 30
+        while True:
+            try:
+                return await self.ledger.backfill(self.bot.rpc, self.bot.config['ACC_NAME'])
+            except Exception as e:
+                # Until it's backfilled the ledger misses votes cast before it, so keep at it
+                self.metrics.inc("task_errors_total", task="backfill_votes", **self.bot.labels)
+                print(e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1800)
 
 
-    async def cog_unload(self):
+    async def close(self):
         self.token_holders.cancel()
+        self.token_events.cancel()
+        self.transfer_watch.cancel()
+        self.mana_release.cancel()
+        self.chain_context.cancel()
+        if self.backfill_task is not None:
+            self.backfill_task.cancel()
+        # Votes still waiting for their batch go out before the signer shuts down
+        self.votes.flush()
+        if self.votes.sending:
+            await asyncio.wait(self.votes.sending, timeout=30)
+        self.broadcaster.close()
+        self.history.save()
 
 
 
@@ -190,110 +252,345 @@ class Commands(commands.Cog, name="Commands"):
 
 
 
+    def repeat(self, key: tuple) -> tuple | None:
+        """The rejection of a post already voted or being voted, known without asking a node"""
+        if key in self.pending or key in self.ledger:
+            return "voted", f"❌ The post has already been voted by {self.bot.config['ACC_NAME']}!"
+        return None
+
+
+    def check_post(self, post) -> tuple | None:
+        """The rejection reason and message for a post that can't be voted, or None"""
+        if self.bot.config['POST_TAG'] != 'None' and self.bot.config['POST_TAG'] not in post.tags:
+            return "tag", f"❌ The post doesn't have the #{self.bot.config['POST_TAG']} tag!"
+        if self.repeat((post.author, post.permlink)):
+            return self.repeat((post.author, post.permlink))
+        if not post.main_post and not self.bot.config['VOTE_COMMENTS']:
+            return "comment", "❌ **You're not allowed to vote comments per this server's curation settings!**"
+        if discord.utils.utcnow() - post.created > timedelta(hours=self.bot.config['CUR_WINDOW']):
+            return "window", f"❌ **The post/comment is older than the __{self.bot.config['CUR_WINDOW']} Hours__ curation window allowed for voting per this server's curation settings!**"
+        return None
+
+
+    def rejected(self, message: discord.Message, reason: str, key: tuple=()) -> None:
+        self.metrics.inc("curation_rejected_total", reason=reason, **self.bot.labels)
+        self.history.add(reason, str(message.author.id), *(key or ()))
+
+
+    async def reject(self, message: discord.Message, reason: str, title: str, link: str, key: tuple=()):
+        self.rejected(message, reason, key)
+        embed = await self.gen_embed()
+        embed.title = title
+        embed.description = f"{link}"
+        with self.metrics.timer("curate_stage_seconds", stage="reply", **self.bot.labels):
+            return await message.reply(embed=embed)
+
+
+
     async def curate(self, message: discord.Message):
         acc = self.bot.db.get(str(message.author.id), None)
         if not acc:
+            self.metrics.inc("curation_rejected_total", reason="unlinked", **self.bot.labels)
+            self.history.add("unlinked", str(message.author.id))
             return
-        link = message.content.split()[0]
+        with self.metrics.timer("curate_stage_seconds", stage="parse", **self.bot.labels):
+            links = find_links(message.content, self.bot.config.get("LINKS_PER_MESSAGE", 10))
+        # Posts already voted are turned away from the ledger, so only the rest are fetched
+        fresh = [key for _, key in links if not self.repeat(key)]
+        try:
+            with self.metrics.timer("curate_stage_seconds", stage="fetch", **self.bot.labels):
+                # Every linked post in one batched request
+                posts = await self.posts.get_many(fresh) if fresh else {}
+        except Exception as e:
+            # The nodes being down says nothing about the links, so they aren't turned away as invalid
+            print(e)
+            for key in fresh:
+                self.rejected(message, "fetch_failed", key)
+            embed = await self.gen_embed()
+            embed.title = "❌ Could not load the post:" if len(fresh) == 1 else f"❌ Could not load the {len(fresh)} posts:"
+            embed.description = "This could be due to Hive nodes being down. Maybe try again in a bit."
+            with self.metrics.timer("curate_stage_seconds", stage="reply", **self.bot.labels):
+                return await message.reply(embed=embed, mention_author=False)
+        if len(links) > 1:
+            return await self.curate_many(message, acc, links, posts)
+        link, key = links[0] if links else (message.content.split()[0], None)
+        post = posts.get(key)
+        with self.metrics.timer("curate_stage_seconds", stage="checks", **self.bot.labels):
+            rejection = (key and self.repeat(key)) or (self.check_post(post) if post else ("invalid_link", "❌ Make sure it's a valid link to a post or comment!"))
+        if rejection:
+            return await self.reject(message, *rejection, link, () if rejection[0] == "invalid_link" else key)
+        # Claimed as soon as it passes the checks, so a second drop of the post is turned away while this one is at work
+        self.pending[key] = str(message.author.id)
+        claimed = True
+        try:
+            with self.metrics.timer("curate_stage_seconds", stage="balance", **self.bot.labels):
+                balance = await self.get_balance(acc)
+            weight = max(min(round(balance / self.bot.config['VOTE_PCT'], 2), 100), 0)
+            if weight <= 0:
+                return self.rejected(message, "no_stake", key)
+            floor = self.bot.config.get("VOTE_MANA_FLOOR", 0)
+            if floor and (self.held or await self.mana.current() < floor):
+                self.metrics.inc("votes_total", result="held", **self.bot.labels)
+                claimed = False
+                return await self.hold_vote(message, link, post, balance, weight)
+            # From here on the vote itself holds the claim and lets go of it once it's cast
+            claimed = False
+            await self.cast_vote(message, link, post, weight)
+        finally:
+            if claimed:
+                self.pending.pop(key, None)
+
+
+
+    async def curate_many(self, message: discord.Message, acc: str, links: list, posts: dict) -> bool | None:
+        """Curates every post linked in one message together, answering with a single summary"""
+        approved, done, lines = [], [], []
+        with self.metrics.timer("curate_stage_seconds", stage="checks", **self.bot.labels):
+            for link, key in links:
+                post = posts.get(key)
+                rejection = self.repeat(key) or (self.check_post(post) if post else ("invalid_link", "❌ Not a valid link to a post or comment!"))
+                if rejection:
+                    self.rejected(message, rejection[0], () if rejection[0] == "invalid_link" else key)
+                    lines.append(f"{rejection[1]}\n{link}")
+                else:
+                    self.pending[key] = str(message.author.id)
+                    approved.append((link, post))
+        weight, held, claimed = 0, False, True
+        try:
+            if approved:
+                with self.metrics.timer("curate_stage_seconds", stage="balance", **self.bot.labels):
+                    balance = await self.get_balance(acc)
+                weight = max(min(round(balance / self.bot.config['VOTE_PCT'], 2), 100), 0)
+                if weight <= 0:
+                    for link, post in approved:
+                        self.rejected(message, "no_stake", (post.author, post.permlink))
+                        self.pending.pop((post.author, post.permlink), None)
+                    approved = []
+            if not approved and not lines:
+                return
+            floor = self.bot.config.get("VOTE_MANA_FLOOR", 0)
+            if approved and floor and (self.held or await self.mana.current() < floor):
+                held, claimed = True, False
+                for link, post in approved:
+                    self.metrics.inc("votes_total", result="held", **self.bot.labels)
+                    eta = self.park_vote(message, link, post, balance, weight)
+                    done.append(f"⏳ Scheduled **__[{post.title}]({link})__** for <t:{eta}:R>")
+            elif approved:
+                # Submitted together, the votes go out in a single transaction
+                claimed = False
+                results = await asyncio.gather(*(self.submit_vote(message, post, weight) for link, post in approved))
+                for (link, post), voted in zip(approved, results):
+                    if voted:
+                        done.append(f":green_circle: **__[{post.title}]({link})__** By: **__[@{post.author}](https://peakd.com/@{post.author})__**")
+                    else:
+                        done.append(f"❌ Could not vote {link}")
+        finally:
+            if claimed:
+                for link, post in approved:
+                    self.pending.pop((post.author, post.permlink), None)
         embed = await self.gen_embed()
+        embed.title = f"Curated {len(links)} links" + (f" with {weight}% each" if approved else "")
+        notice = f"The curation account's voting mana is below **{floor}%**, so scheduled votes will be cast once it recovers." if held else ""
+        embed.description = _fit(done + lines, DESCRIPTION_LIMIT - len(notice) - 2)
+        if notice:
+            embed.description += f"\n\n{notice}"
+        with self.metrics.timer("curate_stage_seconds", stage="reply", **self.bot.labels):
+            await message.reply(embed=embed, mention_author=False)
+        # Keeps the message in the curation queue until its scheduled votes are cast
+        return held or None
+
+
+
+    async def submit_vote(self, message: discord.Message, post, weight: float) -> bool:
+        from beembase.operations import Vote
+        author, permlink = post.author, post.permlink
+        vote = Vote(**{
+                "voter": self.bot.config['ACC_NAME'],
+                "author": author,
+                "permlink": permlink,
+                "weight": int(float(weight) * 100)
+            })
+        # Claim the post before broadcasting so a duplicate submission is turned away at once
+        self.pending[(author, permlink)] = str(message.author.id)
         try:
-            author, permlink = link.split('@', 1)[1].split('/', 1)
-            if '#@' in permlink:
-                author, permlink = permlink.split('#@', 1)[1].split('/', 1)
-            permlink = permlink.split('?', 1)[0]
-            cmt = Comment(f"@{author}/{permlink}")
-        except Exception:
-            embed.title = "❌ Make sure it's a valid link to a post or comment!"
-            embed.description = f"{link}"
-            return await message.reply(embed=embed)
-        if self.bot.config['POST_TAG'] != 'None' and self.bot.config['POST_TAG'] not in cmt.json_metadata.get('tags', []):
-            embed.title = f"❌ The post doesn't have the #{self.bot.config['POST_TAG']} tag!"
-            embed.description = f"{link}"
-            return await message.reply(embed=embed)
-        if cmt.get_vote_with_curation(voter=self.bot.config['ACC_NAME'], raw_data=True):
-            embed.title = f"❌ The post has already been voted by {self.bot.config['ACC_NAME']}!"
-            embed.description = f"{link}"
-            return await message.reply(embed=embed)
-        if not cmt.is_main_post() and not self.bot.config['VOTE_COMMENTS']:
-            embed.title = "❌ **You're not allowed to vote comments per this server's curation settings!**"
-            embed.description = f"{link}"
-            return await message.reply(embed=embed)
-        if cmt.time_elapsed() > timedelta(hours=self.bot.config['CUR_WINDOW']):
-            embed.title = f"❌ **The post/comment is older than the __{self.bot.config['CUR_WINDOW']} Hours__ curation window allowed for voting per this server's curation settings!**"
-            embed.description = f"{link}"
-            return await message.reply(embed=embed)
-        age = round(datetime.timestamp(cmt['created']))
-        self.wallet.change_account(acc)
-        tokens = self.wallet.get_token(self.bot.config['TOKEN_NAME'])
-        balance = float(tokens.get(self.bot.config['TOKEN_TYPE'], 0)) if tokens else 0
-        weight = max(min(round(balance / self.bot.config['VOTE_PCT'], 2), 100), 0)
-        if weight <= 0:
-            return
-        # Vote the post
-        tx = TransactionBuilder(blockchain_instance=self.hive)
-        tx.appendOps(
-            Vote(**{
-                    "voter": self.bot.config['ACC_NAME'],
-                    "author": author,
-                    "permlink": permlink,
-                    "weight": int(float(weight) * 100)
-                })
-        )
-        if await self._broadcast_tx(tx):
+            voted = await self.votes.submit(vote)
+        finally:
+            self.pending.pop((author, permlink), None)
+        self.metrics.inc("votes_total", result="cast" if voted else "failed", **self.bot.labels)
+        self.history.add("cast" if voted else "failed", str(message.author.id), author, permlink, weight if voted else 0.0)
+        if voted:
+            self.mana.spend(weight)
+        return voted
+
+
+    async def cast_vote(self, message: discord.Message, link: str, post, weight: float):
+        author = post.author
+        embed = await self.gen_embed()
+        age = round(post.created.timestamp())
+        if await self.submit_vote(message, post, weight):
             embed.title = ""
-            embed.description = f":green_circle: **Voted __[{cmt.title}]({link})__** By: **__[@{author}](https://peakd.com/@{author})__** With **__{weight}__%**\n\n>>> Created On: <t:{age}:F> ~ <t:{age}:R>\nPending Reward Payout: **{cmt.reward}**\nPost URL: **{link}**"
-            try:
-                embed.set_thumbnail(url=cmt.json_metadata.get('image', cmt.json_metadata.get('images', [self.bot.get_guild(self.bot.guild_id).icon]))[0])
-            except Exception:
-                pass
+            embed.description = f":green_circle: **Voted __[{post.title}]({link})__** By: **__[@{author}](https://peakd.com/@{author})__** With **__{weight}__%**\n\n>>> Created On: <t:{age}:F> ~ <t:{age}:R>\nPending Reward Payout: **{post.reward}**\nPost URL: **{link}**"
+            embed.set_thumbnail(url=post.image or self.bot.get_guild(self.bot.guild_id).icon)
         else:
             embed.title = "❌ Could not vote:"
             embed.description = f">>> {link}\n\nThis could be due to Hive nodes being down, or an invalid account/posting key. Maybe try again in a bit."
+        with self.metrics.timer("curate_stage_seconds", stage="reply", **self.bot.labels):
+            await message.reply(embed=embed, mention_author=False)
+
+
+
+    def park_vote(self, message: discord.Message, link: str, post, balance: float, weight: float) -> int:
+        """Parks an approved vote until the curation account's mana is back above the floor, returning when it's expected"""
+        deadline = post.created.timestamp() + self.bot.config['CUR_WINDOW'] * 3600
+        ahead = self.held.push(balance, deadline, weight, (message, link, post, weight))
+        self.pending[(post.author, post.permlink)] = str(message.author.id)
+        return round(time.time() + self.mana.eta(self.bot.config['VOTE_MANA_FLOOR'] + ahead))
+
+
+    async def hold_vote(self, message: discord.Message, link: str, post, balance: float, weight: float) -> bool:
+        floor = self.bot.config['VOTE_MANA_FLOOR']
+        deadline = post.created.timestamp() + self.bot.config['CUR_WINDOW'] * 3600
+        eta = self.park_vote(message, link, post, balance, weight)
+        embed = await self.gen_embed()
+        embed.title = "⏳ Vote scheduled"
+        embed.description = f"The curation account's voting mana is below **{floor}%**, so this vote will be cast once it recovers.\n\n>>> Post: **__[{post.title}]({link})__**\nWeight: **__{weight}__%**\nEstimated vote time: <t:{eta}:F> ~ <t:{eta}:R>"
+        if eta > deadline:
+            embed.description += f"\n\nThe post may leave the __{self.bot.config['CUR_WINDOW']} Hours__ curation window before then."
         await message.reply(embed=embed, mention_author=False)
+        # Keeps the link in the curation queue until the vote is actually cast
+        return True
 
 
 
-    async def _broadcast_tx(self, tx: TransactionBuilder | None=None) -> bool:
-        if not tx:
-            return False
-        try:
-            tx.appendWif(self.bot.config['ACC_WIF'])
-            tx.sign()
-            tx.broadcast()
-        except Exception as e:
-            print(e)
+    async def _broadcast_tx(self, ops: list | None=None) -> bool:
+        if not ops:
             return False
+        retries = self.bot.config.get("BROADCAST_RETRIES", 3)
+        tx = None
+        for attempt in range(retries + 1):
+            try:
+                if tx is None:
+                    with self.metrics.timer("curate_stage_seconds", stage="sign", **self.bot.labels):
+                        tx = await self.broadcaster.sign(ops)
+                with self.metrics.timer("curate_stage_seconds", stage="broadcast", **self.bot.labels):
+                    # Retries resend the same signed transaction, so one that timed out but landed can't be cast twice
+                    await self.broadcaster.send(tx)
+                break
+            except node_errors() as e:
+                # Node trouble is usually brief, so back off and try again
+                self.metrics.inc("task_errors_total", task="broadcast", **self.bot.labels)
+                print(e)
+                if attempt == retries:
+                    return False
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                if attempt and already_applied(e):
+                    # An earlier attempt reached the chain after all
+                    break
+                self.metrics.inc("task_errors_total", task="broadcast", **self.bot.labels)
+                print(e)
+                return False
+        for op in ops:
+            vote = op.json()
+            try:
+                self.ledger.add(vote['author'], vote['permlink'], self.pending.get((vote['author'], vote['permlink']), ""))
+            except OSError as e:
+                # The vote is on chain either way, so a failed ledger write doesn't make it a failed vote
+                print(e)
         return True
 
 
+    async def get_balance(self, acc: str) -> float:
+        return await self.holders.get(acc)
+
 
     async def get_holders(self) -> dict:
-        lmt, n = 1000, 1
-        token = Token(self.bot.config['TOKEN_NAME'], api=Api(url='https://api.hive-engine.com/rpc/'))
-        h_list = token.get_holder(limit=lmt, offset=0)
-        holders = {}
-        while h_list:
-            holders.update({x['account']: float(x[self.bot.config['TOKEN_TYPE']]) for x in h_list if float(x[self.bot.config['TOKEN_TYPE']]) >= self.bot.config['MIN_TOKENS']})
-            if len(h_list) < lmt or n > 10:
-                break
-            h_list = token.get_holder(limit=lmt, offset=lmt*n)
-            n += 1
-        return holders
+        # Another project with the same token may have just refreshed the shared index
+        if self.holders.stale:
+            await self.holders.refresh()
+        return self.holders.eligible(self.bot.config['MIN_TOKENS'])
 
 
     async def update_roles(self):
         permitted = await self.get_holders()
         guild = self.bot.get_guild(self.bot.guild_id)
         role = guild.get_role(self.bot.role_id)
-        for k, v in self.bot.db.items():
-            user = await guild.fetch_member(k)
-            if v in permitted:
-                if role not in user.roles:
-                    await user.add_roles(role)
-            else:
-                if role in user.roles:
-                    await user.remove_roles(role)
-            await asyncio.sleep(2)
+        with self.metrics.timer("role_reconcile_seconds", scope="full", **self.bot.labels):
+            return await reconcile_roles(guild, role, dict(self.bot.db), permitted, self.bot.config.get("ROLE_CONCURRENCY", 5), self.bot.members)
+
+
+    async def apply_token_events(self):
+        """Updates the balances and roles of only the holders touched by new sidechain blocks"""
+        changed = await self.feed.poll(self)
+        links = {self.bot.db.owner(acc): acc for acc in changed if self.bot.db.owner(acc)}
+        if not links:
+            return
+        guild = self.bot.get_guild(self.bot.guild_id)
+        role = guild.get_role(self.bot.role_id)
+        permitted = {acc for acc in links.values() if self.holders.balances.get(acc, 0.0) >= self.bot.config['MIN_TOKENS']}
+        with self.metrics.timer("role_reconcile_seconds", scope="events", **self.bot.labels):
+            return await reconcile_roles(guild, role, links, permitted, self.bot.config.get("ROLE_CONCURRENCY", 5), self.bot.members)
+
+
+    @tasks.loop(seconds=10.0)
+    async def token_events(self):
+        try:
+            await self.apply_token_events()
+        except Exception as e:
+            self.metrics.inc("task_errors_total", task="token_events", **self.bot.labels)
+            print(e)
+
+
+    @tasks.loop(seconds=30.0)
+    async def chain_context(self):
+        # Keeps the reference block fresh so broadcasts never have to fetch it first
+        try:
+            await self.broadcaster.refresh()
+        except Exception as e:
+            self.metrics.inc("task_errors_total", task="chain_context", **self.bot.labels)
+            print(e)
+
+
+    @chain_context.before_loop
+    async def before_chain_context(self):
+        await self.bot.wait_until_ready()
+
+
+    @tasks.loop(seconds=60.0)
+    async def mana_release(self):
+        try:
+            while self.held and await self.mana.current() >= self.bot.config['VOTE_MANA_FLOOR']:
+                message, link, post, weight = self.held.pop()
+                self.pending.pop((post.author, post.permlink), None)
+                if discord.utils.utcnow() - post.created > timedelta(hours=self.bot.config['CUR_WINDOW']):
+                    self.metrics.inc("curation_rejected_total", reason="window_while_held", **self.bot.labels)
+                    self.history.add("window_while_held", str(message.author.id), post.author, post.permlink)
+                    embed = await self.gen_embed()
+                    embed.title = f"❌ **The post/comment left the __{self.bot.config['CUR_WINDOW']} Hours__ curation window before voting mana recovered!**"
+                    embed.description = f"{link}"
+                    await message.reply(embed=embed)
+                else:
+                    await self.cast_vote(message, link, post, weight)
+                # A message with several links stays queued until the last of its votes is out
+                if not any(entry[0].id == message.id for *_, entry in self.held.heap):
+                    self.bot.curation.finish(message.id)
+        except Exception as e:
+            self.metrics.inc("task_errors_total", task="mana_release", **self.bot.labels)
+            print(e)
+
+
+    @tasks.loop(seconds=15.0)
+    async def transfer_watch(self):
+        try:
+            await self.transfers.poll()
+        except Exception as e:
+            self.metrics.inc("task_errors_total", task="transfer_watch", **self.bot.labels)
+            print(e)
+
+
+    @transfer_watch.before_loop
+    async def before_transfer_watch(self):
+        await self.bot.wait_until_ready()
 
 
     @tasks.loop(hours=24.0)
@@ -301,33 +598,203 @@ class Commands(commands.Cog, name="Commands"):
         try:
             await self.update_roles()
         except Exception as e:
+            self.metrics.inc("task_errors_total", task="token_holders", **self.bot.labels)
             print(e)
 
 
 
-    @app_commands.guild_only()
-    @app_commands.command(name="register", description="Link a Hive account.")
-    @app_commands.describe(account="The Hive account to link with your Discord user")
     async def register(self, interaction: discord.Interaction, account: str):
         acc = account.strip(" @").lower()
         if self.bot.db.get(str(interaction.user.id), '') == acc:
             return await interaction.response.send_message(f"**Your Discord user is already linked to the Hive account __@{acc}__! Enter a different account name and verify it if you want to re-link your Discord user with a different Hive account.**", ephemeral=True)
-        if acc in self.bot.db.values():
+        if self.bot.db.owner(acc) is not None:
             return await interaction.response.send_message(f"**The Hive account __@{acc}__ is already linked to a different user!**", ephemeral=True)
-        hacc = await HiveAcc(account.strip(" @").lower())
+        # The account index turns away unknown names without asking a node
+        if self.bot.accounts is not None and self.bot.accounts.exists(acc) is False:
+            hacc = None
+        else:
+            hacc = await HiveAcc(self.bot, acc)
         if not hacc:
             return await interaction.response.send_message(f"**The Hive account __@{acc}__ doesn't exist! Make sure you entered the correct account name.**", ephemeral=True)
-        view = BotView(await commands.Context.from_interaction(interaction), hacc)
+        view = BotView(await commands.Context.from_interaction(interaction), hacc, self)
         return await view.link_acc(interaction)
 
 
+    async def stats(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            return await interaction.response.send_message("**Only server admins can see the bot's stats!**", ephemeral=True)
+        metrics, labels = self.metrics, self.bot.labels
+        curations = sum(h.count for h in metrics.series("curation_seconds", **labels).values())
+        votes = metrics.count("votes_total", **labels)
+        embed = await self.gen_embed()
+        embed.title = "📊 Stats"
+        embed.description = (
+            f"Up for **{timedelta(seconds=round(metrics.uptime))}**\n"
+            f"Curations: **{curations}** (~{curations / max(metrics.uptime / 3600, 1 / 60):.1f}/h) | "
+            f"Votes cast: **{votes.get(('cast',), 0)}** | Failed: **{votes.get(('failed',), 0)}** | Held: **{votes.get(('held',), 0)}**\n"
+            f"Queue depth: **{self.bot.curation.depth}** | Held votes: **{len(self.held)}**\n"
+            "Latencies below are p50 / p95 / p99 in ms, then the number of samples."
+        )
+        stages = metrics.series("curate_stage_seconds", **labels)
+        rows = [(stage, stages[(stage,)]) for stage in ("parse", "fetch", "checks", "balance", "sign", "broadcast", "reply") if (stage,) in stages]
+        rows += [(name, h) for name, series in (("queue_wait", "curation_queue_wait_seconds"), ("curation", "curation_seconds"), ("verify", "verify_seconds")) for h in metrics.series(series, **labels).values()]
+        embed.add_field(name="Curate pipeline", value=_table(rows), inline=False)
+        nodes = sorted(metrics.series("rpc_seconds").items())
+        embed.add_field(name="Hive nodes", value=_table([(f"{url.split('//')[-1]}{'' if ok == 'true' else ' ✗'}", h) for (url, ok), h in nodes]), inline=False)
+        rows = [("holder_refresh", h) for h in metrics.series("holder_refresh_seconds", token=self.holders.symbol).values()]
+        rows += [(f"roles_{scope}", h) for (scope,), h in metrics.series("role_reconcile_seconds", **labels).items()]
+        embed.add_field(name="Holders and roles", value=_table(rows), inline=False)
+        rejected = metrics.count("curation_rejected_total", **labels)
+        errors = metrics.count("task_errors_total", **labels)
+        embed.add_field(name="Rejections", value="\n".join(f"{reason}: **{n}**" for (reason,), n in sorted(rejected.items())) or "None", inline=True)
+        embed.add_field(name="Task errors", value="\n".join(f"{task}: **{n}**" for (task,), n in sorted(errors.items())) or "None", inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+    async def leaderboard(self, interaction: discord.Interaction, period: int):
+        if not interaction.user.guild_permissions.administrator:
+            return await interaction.response.send_message("**Only server admins can see the leaderboard!**", ephemeral=True)
+        rollup = self.history.period(period)
+        embed = await self.gen_embed()
+        embed.title = f"🏆 Leaderboard, {_period_name(period)}"
+        embed.description = _summary(rollup.results)
+        curators = [
+            f"{i}. <@{curator}> **{t['cast']}** votes, **{t['weight']:g}%** weight"
+            for i, (curator, t) in enumerate(ranked(rollup.curators), 1) if t["cast"]
+        ]
+        embed.add_field(name="Curators", value="\n".join(curators)[:1024] or "No votes yet", inline=False)
+        authors = [
+            f"{i}. [@{author}](https://peakd.com/@{author}) **{t['cast']}** votes, **{t['weight']:g}%** weight"
+            for i, (author, t) in enumerate(ranked(rollup.authors), 1)
+        ]
+        embed.add_field(name="Top authors", value="\n".join(authors)[:1024] or "No votes yet", inline=False)
+        embed.add_field(name="Turned away", value=_reasons(rollup.results), inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+    async def curator_stats(self, interaction: discord.Interaction, member: discord.Member, period: int):
+        if not interaction.user.guild_permissions.administrator:
+            return await interaction.response.send_message("**Only server admins can see curator stats!**", ephemeral=True)
+        tally = self.history.period(period).curators.get(str(member.id), {})
+        embed = await self.gen_embed()
+        embed.title = f"📈 {member}, {_period_name(period)}"
+        acc = self.bot.db.get(str(member.id), None)
+        embed.description = (f"Linked to **[@{acc}](https://peakd.com/@{acc})**\n" if acc else "Not linked to a Hive account\n") + _summary(tally)
+        if tally.get("cast"):
+            embed.description += f"\nAverage vote weight: **{tally['weight'] / tally['cast']:.2f}%**"
+        embed.add_field(name="Turned away", value=_reasons(tally), inline=True)
+        embed.add_field(name="Votes a day, last 14 days", value="```\n" + " ".join(str(n) for n in self.history.daily(str(member.id))) + "\n```", inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+
+
+class Commands(commands.Cog, name="Commands"):
+    """The bot's commands, answered by the curation project of the server they're used in"""
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+
+
+    async def cog_unload(self):
+        for tenant in self.bot.tenants.values():
+            await tenant.engine.close()
+
+
+    def engine(self, interaction: discord.Interaction) -> Curation:
+        return self.bot.tenants[interaction.guild_id].engine
+
+
+
+    @app_commands.guild_only()
+    @app_commands.command(name="register", description="Link a Hive account.")
+    @app_commands.describe(account="The Hive account to link with your Discord user")
+    async def register(self, interaction: discord.Interaction, account: str):
+        return await self.engine(interaction).register(interaction, account)
+
+
+    @register.autocomplete("account")
+    async def register_account(self, interaction: discord.Interaction, current: str) -> list:
+        if self.bot.accounts is None:
+            return []
+        return [app_commands.Choice(name=name, value=name) for name in self.bot.accounts.complete(current)]
+
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.command(name="stats", description="Show where the bot spends its time.")
+    async def stats(self, interaction: discord.Interaction):
+        return await self.engine(interaction).stats(interaction)
+
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.command(name="leaderboard", description="Show the top curators and the authors they voted.")
+    @app_commands.describe(period="How far back to count")
+    @app_commands.choices(period=PERIODS)
+    async def leaderboard(self, interaction: discord.Interaction, period: int=30):
+        return await self.engine(interaction).leaderboard(interaction, period)
+
+
+    @app_commands.guild_only()
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.command(name="curator-stats", description="Show a curator's votes and turned away links.")
+    @app_commands.describe(member="The curator to show", period="How far back to count")
+    @app_commands.choices(period=PERIODS)
+    async def curator_stats(self, interaction: discord.Interaction, member: discord.Member, period: int=30):
+        return await self.engine(interaction).curator_stats(interaction, member, period)
+
+
+
+
+
+
+
+
+
+
+def _table(rows: list) -> str:
+    if not rows:
+        return "No samples yet"
+    lines = [
+        f"{name[:24]:<24} {h.quantile(0.5) * 1000:>6.0f} {h.quantile(0.95) * 1000:>6.0f} {h.quantile(0.99) * 1000:>6.0f} {h.count:>6}"
+        for name, h in rows
+    ]
+    return "```\n" + "\n".join(lines)[:1000] + "\n```"
+
+
+def _fit(entries: list, limit: int) -> str:
+    """Joins whole entries up to limit characters, saying how many more didn't fit"""
+    text = ""
+    for i, entry in enumerate(entries):
+        more = f"\n\n...and {len(entries) - i} more"
+        joined = f"{text}\n\n{entry}" if text else entry
+        if len(joined) + (len(more) if i < len(entries) - 1 else 0) > limit:
+            return (text + more).strip()
+        text = joined
+    return text
+
+
+def _period_name(days: int) -> str:
+    return f"last {days} days" if days else "all time"
 
 
+def _summary(tally: dict) -> str:
+    turned_away = sum(n for result, n in tally.items() if result not in ("cast", "failed", "weight"))
+    return (
+        f"Votes cast: **{tally.get('cast', 0)}** | Weight given: **{tally.get('weight', 0):g}%** | "
+        f"Failed: **{tally.get('failed', 0)}** | Turned away: **{turned_away}**"
+    )
 
 
+def _reasons(tally: dict) -> str:
+    reasons = sorted((n, result) for result, n in tally.items() if result not in ("cast", "failed", "weight"))
+    return "\n".join(f"{result}: **{n}**" for n, result in reversed(reasons)) or "None"
 
 
 
 
 async def setup(bot: commands.Bot):
+    for tenant in bot.tenants.values():
+        tenant.engine = Curation(tenant)
+        await tenant.engine.start()
     await bot.add_cog(Commands(bot))
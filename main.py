@@ -1,12 +1,29 @@
 __version__ = '1.0.0'
 
+import time
+START = time.perf_counter()
+
 import asyncio
 import discord
+import hashlib
 import json
 import logging
+import sys
+
+
+from discord.ext import commands, tasks
+from utils.accounts import AccountIndex
+from utils.members import MemberCache
+from utils.metrics import Metrics
+from utils.nodes import NodePool
+from utils.posts import LINK
+from utils.rpc import RPCPool
+from utils.startup import StartupProfile
+from utils.tenants import Tenant, TokenFeeds, tenant_configs
 
 
-from discord.ext import commands
+profile = StartupProfile("--profile-startup" in sys.argv, START)
+profile.mark("imports")
 
 
 description = """
@@ -19,36 +36,83 @@ logger = logging.getLogger("Bot")
 
 
 
+def gateway_options(lean: bool) -> dict:
+    """Intents and cache settings for the gateway connection"""
+    if not lean:
+        return {"intents": discord.Intents.all()}
+    # Only what the bot uses: the guild itself, dropped links and member role changes.
+    # No presences, no member chunking, and members are looked up when they are needed
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.message_content = True
+    intents.members = True
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    }
+
+
+
 class HiveDisCured(commands.Bot):
-    def __init__(self, config: dict):
-        intents = discord.Intents.all()
+    def __init__(self, config: dict, profile: StartupProfile | None=None):
+        lean = config.get("LEAN_GATEWAY", False)
         super().__init__(
             command_prefix="",
             description=description,
-            intents=intents,
             help_command=None,
-            case_insensitive=True
+            case_insensitive=True,
+            **gateway_options(lean)
         )
-        self.guild_id = config.get("GUILD_ID", 0)
-        self.role_id = config.get("ROLE_ID", 0)
-        self.chan_id = config.get("CHAN_ID", 0)
         self.blacklist = []
-        self.db = {}
+        self.members = MemberCache(config.get("MEMBER_CACHE", 1000)) if lean else None
+        self.metrics = Metrics()
+        self.metrics_server = None
         self.config = config
+        self.nodes = NodePool(config.get("HIVE_NODES"), workers=config.get("RPC_WORKERS", 8), metrics=self.metrics)
+        self.rpc = RPCPool(config.get("RPC_WORKERS", 8), nodes=self.nodes)
         self.color = discord.Colour.dark_gold()
+        self.accounts = AccountIndex() if config.get("ACCOUNT_INDEX", True) else None
+        self.profile = profile or StartupProfile(False, START)
+        # Every curation project by guild ID, sharing the gateway connection, Hive nodes and token indexes
+        self.tokens = TokenFeeds(self.rpc, "tenants" if "TENANTS" in config else "", self.metrics)
+        self.tenants = {}
+        projects = tenant_configs(config)
+        for tenant_config, folder in projects:
+            tenant = Tenant(self, tenant_config, folder, len(projects))
+            self.tenants[tenant.guild_id] = tenant
 
 
 
     async def startup(self):
         await self.wait_until_ready()
+        self.profile.mark("gateway ready")
+        warm = self.loop.create_task(self.warm_up())
         logger.info("--------------------")
         for g in self.guilds:
-            if g.id != self.guild_id:
+            if g.id not in self.tenants:
                 logger.error(f"Server ID mismatch! Leaving the server: {g.name}")
                 await g.leave()
-        guild = self.get_guild(self.guild_id)
-        if guild:
-            await self._setguild(guild)
+        for tenant in self.tenants.values():
+            guild = self.get_guild(tenant.guild_id)
+            if guild:
+                await self._setguild(guild)
+            tenant.curation.start()
+        self.profile.mark("guild set up")
+        await warm
+        self.profile.report()
+
+
+
+    async def warm_up(self) -> None:
+        """Loads the Hive libraries and connects a Hive client in the background, once the gateway is up"""
+        try:
+            await self.rpc.hive(lambda hive: hive.rpc.url)
+        except Exception as e:
+            logger.error(f"Connecting to a Hive node failed: {e}")
+        self.profile.mark("hive client ready")
 
 
 
@@ -60,18 +124,56 @@ class HiveDisCured(commands.Bot):
                 await self.load_extension(extension)
             except Exception as e:
                 logger.exception(f'Failed to load {extension}\nError: {e}')
+        self.profile.mark("cogs loaded")
         # Startup Tasks
+        if self.config.get("METRICS_PORT"):
+            try:
+                self.metrics_server = await self.metrics.serve(self.config["METRICS_PORT"])
+            except OSError as e:
+                logger.error(f"Could not serve metrics on port {self.config['METRICS_PORT']}: {e}")
+        self.node_health.start()
+        if self.accounts is not None:
+            self.account_index.start()
         self.loop.create_task(self.startup())
 
 
 
+    @tasks.loop(seconds=60.0)
+    async def node_health(self):
+        try:
+            await self.rpc.run(self.nodes.probe)
+        except Exception as e:
+            logger.error(f"Node health check failed: {e}")
+
+
+    @node_health.before_loop
+    async def before_node_health(self):
+        await self.wait_until_ready()
+
+
+    @tasks.loop(seconds=60.0)
+    async def account_index(self):
+        try:
+            if not self.accounts.built:
+                await self.accounts.build(self.rpc)
+            await self.accounts.follow(self.rpc)
+        except Exception as e:
+            logger.error(f"Updating the Hive account index failed: {e}")
+
+
+    @account_index.before_loop
+    async def before_account_index(self):
+        await self.wait_until_ready()
+
+
+
     async def on_message(self, message: discord.Message) -> None:
-        if message.guild is None or message.channel.id != self.chan_id:
+        tenant = self.tenants.get(message.guild.id) if message.guild else None
+        if tenant is None or message.channel.id != tenant.chan_id:
             return
-        if message.guild.get_role(self.role_id) not in message.author.roles or not message.content.startswith("https://peakd.com/"):
+        if message.guild.get_role(tenant.role_id) not in message.author.roles or not LINK.search(message.content):
             return
-        self.loop.create_task(self.get_cog('Commands').curate(message))
-        
+        await tenant.curation.put(message)
 
 
     async def on_guild_join(self, guild: discord.Guild) -> None:
@@ -80,16 +182,18 @@ class HiveDisCured(commands.Bot):
 
 
     async def on_guild_remove(self, guild: discord.Guild) -> None:
-        if guild.id == self.guild_id:
-            self.chan_id, self.role_id, self.config["CHAN_ID"], self.config["ROLE_ID"] = 0, 0, 0, 0
-            with open("config.json", "w") as f:
-                json.dump(self.config, f, indent=4)
-            self.get_cog('Commands').token_holders.cancel()
+        tenant = self.tenants.get(guild.id)
+        if tenant is not None:
+            tenant.chan_id, tenant.role_id = 0, 0
+            tenant.save_config()
+            tenant.engine.token_holders.cancel()
+            tenant.engine.token_events.cancel()
 
 
 
     async def _setguild(self, guild: discord.Guild) -> None:
-        if guild.id != self.guild_id:
+        tenant = self.tenants.get(guild.id)
+        if tenant is None:
             logger.error(f"Server ID mismatch! Leaving the server: {guild.name}")
             return await guild.leave()
         #Bot permissions check
@@ -104,41 +208,53 @@ class HiveDisCured(commands.Bot):
             logger.critical("Bot doesn't have the required permissions! Re-Invite the bot with the following permissions:\n- View Channels\n- Read Messages\n- Send Messages\n- Read Message History\n- Embed Links\n- Manage Roles\n- Manage Channels")
             return await guild.leave()
         #Setup role and channel to use
-        if guild.get_role(self.role_id) is None:
+        if guild.get_role(tenant.role_id) is None:
             #create role
             role = await guild.create_role(name="Curator", color=self.color)
-            self.role_id = role.id
+            tenant.role_id = role.id
             logger.info(f"Created role {role.name} in {guild.name}")
         else:
-            logger.info(f"Using role {guild.get_role(self.role_id)}")
+            logger.info(f"Using role {guild.get_role(tenant.role_id)}")
             
-        if self.get_channel(self.chan_id) is None:
+        if self.get_channel(tenant.chan_id) is None:
             #create private channel with permission overwrites
-            permitted_role = guild.get_role(self.role_id)
+            permitted_role = guild.get_role(tenant.role_id)
             overwrites = {
                 guild.default_role: discord.PermissionOverwrite(view_channel=False),
                 permitted_role: discord.PermissionOverwrite(view_channel=True),
                 guild.me: discord.PermissionOverwrite(view_channel=True)
             }
-            chan = await guild.create_text_channel("👑curation-station", overwrites=overwrites, topic="Drop peakd links to the posts for curation!", slowmode_delay=21600)
-            self.chan_id = chan.id
+            chan = await guild.create_text_channel("👑curation-station", overwrites=overwrites, topic="Drop links to the posts for curation!", slowmode_delay=21600)
+            tenant.chan_id = chan.id
             logger.info(f"Created channel {chan.name} in {guild.name}")
         else:
-            logger.info(f"Using Channel {self.get_channel(self.chan_id)}")
+            logger.info(f"Using Channel {self.get_channel(tenant.chan_id)}")
         
-        if self.config.get("CHAN_ID", 0) != self.chan_id or self.config.get("ROLE_ID", 0) != self.role_id:
-            self.config["CHAN_ID"] = self.chan_id
-            self.config["ROLE_ID"] = self.role_id
-            with open("config.json", "w") as f:
-                json.dump(self.config, f, indent=4)
-        # Load linked accounts
-        try:
-            with open("db.json", "r") as f:
-                self.db = json.load(f)
-        except FileNotFoundError:
-            self.db = {}
+        if tenant.config.get("CHAN_ID", 0) != tenant.chan_id or tenant.config.get("ROLE_ID", 0) != tenant.role_id:
+            tenant.save_config()
+        await self.sync_commands()
+        tenant.engine.token_holders.start()
+        if tenant.config.get("ENGINE_EVENTS", True):
+            tenant.engine.token_events.start()
+
+
+
+    async def sync_commands(self) -> None:
+        """Syncs the slash commands with Discord only when they changed since the last sync"""
+        signatures = json.dumps([self.application_id, [c.to_dict() for c in self.tree.get_commands()]], sort_keys=True, default=str)
+        digest = hashlib.sha256(signatures.encode()).hexdigest()
+        if self.config.get("COMMANDS_HASH") == digest:
+            logger.info("Slash commands are unchanged, skipping the sync")
+            return
         await self.tree.sync()
-        self.get_cog('Commands').token_holders.start()
+        self.config["COMMANDS_HASH"] = digest
+        self.save_config()
+
+
+
+    def save_config(self) -> None:
+        with open("config.json", "w") as f:
+            json.dump(self.config, f, indent=4)
 
 
 
@@ -147,6 +263,19 @@ class HiveDisCured(commands.Bot):
 
 
 
+    async def close(self) -> None:
+        await asyncio.gather(*(t.curation.close(self.config.get("DRAIN_TIMEOUT", 30)) for t in self.tenants.values()))
+        self.node_health.cancel()
+        self.account_index.cancel()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        await super().close()
+        self.rpc.close()
+        for tenant in self.tenants.values():
+            tenant.db.close()
+
+
+
 
             
 
@@ -191,7 +320,8 @@ async def configure():
 async def main():
     # Populate config variables and run the bot
     config = await configure()
-    async with HiveDisCured(config) as bot:
+    profile.mark("config loaded")
+    async with HiveDisCured(config, profile) as bot:
         await bot.start()
 
 
@@ -0,0 +1,200 @@
+import bisect
+import heapq
+import json
+import logging
+import mmap
+import os
+import re
+import time
+
+
+logger = logging.getLogger("Bot")
+
+# Hive account names are at most 16 characters, so every name fits one fixed width record
+WIDTH = 16
+NAME = re.compile(r"^(?=.{3,16}$)[a-z][a-z0-9-]+[a-z0-9](\.[a-z][a-z0-9-]+[a-z0-9])*$")
+CREATE_OPS = ("account_create", "account_create_with_delegation", "create_claimed_account")
+
+
+
+def _key(name: str) -> bytes:
+    return name.encode().ljust(WIDTH, b"\0")
+
+
+
+class _Records:
+    """The index file as a sequence of names, padded to WIDTH bytes, for bisect"""
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __len__(self) -> int:
+        return len(self.buffer) // WIDTH
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.buffer[i * WIDTH:(i + 1) * WIDTH]
+
+
+
+class AccountIndex:
+    """Every Hive account name, to tell whether an account exists and complete names without asking a node.
+
+    The names are kept sorted in a file of fixed width records that is memory
+    mapped and binary searched, so the few million names cost page cache rather
+    than process memory. It is built once by paging through lookup_accounts,
+    then accounts created since are read from new irreversible blocks and
+    merged into the file once enough of them pile up.
+    """
+    def __init__(self, path: str="accounts.idx", page_size: int=1000, blocks: int=100, merge_over: int=5000):
+        self.path = path
+        self.state_path = f"{os.path.splitext(path)[0]}.json"
+        self.page_size = page_size
+        self.blocks = blocks
+        self.merge_over = merge_over
+        self.map = None
+        self.records = _Records(b"")
+        self.recent = []
+        self.block = None
+        self.built = False
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+            self.block, self.built, self.recent = state.get("block"), state.get("built", False), sorted(state.get("recent", []))
+        except (FileNotFoundError, ValueError):
+            pass
+        if self.built:
+            try:
+                self._open()
+            except (OSError, ValueError) as e:
+                # A lost or unreadable index file is rebuilt by the account_index task rather than stopping the bot
+                logger.warning(f"Rebuilding the Hive account index, {self.path} can't be read: {e}")
+                self.built, self.block, self.recent = False, None, []
+
+
+    def __len__(self) -> int:
+        return len(self.records) + len(self.recent)
+
+
+    def _open(self) -> None:
+        old = self.map
+        with open(self.path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else None
+        self.records = _Records(self.map if self.map is not None else b"")
+        if old is not None:
+            old.close()
+
+
+    def save(self) -> None:
+        with open(f"{self.state_path}.tmp", "w") as f:
+            json.dump({"built": self.built, "block": self.block, "recent": self.recent}, f)
+        os.replace(f"{self.state_path}.tmp", self.state_path)
+
+
+    def exists(self, name: str) -> bool | None:
+        """Whether the account exists, or None while the index is still being built"""
+        if not self.built or len(name) > WIDTH:
+            # Some names from the chain's early days break today's rules, so the rules only decide before the index is ready
+            return None if NAME.match(name) else False
+        key = _key(name)
+        i = bisect.bisect_left(self.records, key)
+        if i < len(self.records) and self.records[i] == key:
+            return True
+        i = bisect.bisect_left(self.recent, name)
+        return i < len(self.recent) and self.recent[i] == name
+
+
+    def complete(self, prefix: str, limit: int=25) -> list:
+        """Up to limit account names starting with prefix, in order"""
+        prefix = prefix.strip(" @").lower()
+        if not self.built or not prefix or len(prefix) > WIDTH:
+            return []
+        names, start = [], prefix.encode()
+        i = bisect.bisect_left(self.records, start)
+        while i < len(self.records) and len(names) < limit:
+            record = self.records[i]
+            if not record.startswith(start):
+                break
+            names.append(record.rstrip(b"\0").decode())
+            i += 1
+        j = bisect.bisect_left(self.recent, prefix)
+        while j < len(self.recent) and self.recent[j].startswith(prefix):
+            names.append(self.recent[j])
+            j += 1
+        return sorted(set(names))[:limit]
+
+
+    def _page(self, hive, start: str) -> list:
+        return hive.rpc.lookup_accounts(start, self.page_size)
+
+
+    def _irreversible(self, hive) -> int:
+        return hive.rpc.get_dynamic_global_properties(api="database")["last_irreversible_block_num"]
+
+
+    async def build(self, rpc) -> None:
+        """Pages through every account name into the index file, resuming an interrupted build"""
+        start_time, tmp = time.perf_counter(), f"{self.path}.tmp"
+        if self.block is None:
+            # Accounts created while the build runs are picked up from the blocks after this one
+            self.block = await rpc.hive(self._irreversible)
+            await rpc.run(self.save)
+        last = ""
+        if os.path.exists(tmp):
+            size = os.path.getsize(tmp) // WIDTH * WIDTH
+            with open(tmp, "rb+") as f:
+                f.truncate(size)
+                if size:
+                    f.seek(size - WIDTH)
+                    last = f.read(WIDTH).rstrip(b"\0").decode()
+        with open(tmp, "ab") as f:
+            while True:
+                # One request per page keeps the build from holding an RPC worker for minutes
+                page = [name for name in await rpc.hive(self._page, last) if name > last]
+                if not page:
+                    break
+                f.write(b"".join(_key(name) for name in page))
+                last = page[-1]
+        os.replace(tmp, self.path)
+        self.built = True
+        self._open()
+        await rpc.run(self.save)
+        logger.info(f"Indexed {len(self.records)} Hive accounts in {time.perf_counter() - start_time:.0f}s")
+
+
+    def _created(self, hive, start: int, count: int) -> list:
+        blocks = hive.rpc.get_block_range({"starting_block_num": start, "count": count}, api="block")["blocks"]
+        names = []
+        for block in blocks:
+            for tx in block.get("transactions", []):
+                for op in tx.get("operations", []):
+                    kind, value = (op["type"], op["value"]) if isinstance(op, dict) else op
+                    if kind.removesuffix("_operation") in CREATE_OPS:
+                        names.append(value["new_account_name"])
+        return names
+
+
+    async def follow(self, rpc) -> int:
+        """Adds the accounts created in the irreversible blocks since the last call, returning how many"""
+        latest = await rpc.hive(self._irreversible)
+        added = 0
+        while self.block < latest:
+            count = min(self.blocks, latest - self.block)
+            for name in await rpc.hive(self._created, self.block + 1, count):
+                if not self.exists(name):
+                    bisect.insort(self.recent, name)
+                    added += 1
+            self.block += count
+        if len(self.recent) >= self.merge_over:
+            await rpc.run(self._merge, list(self.recent))
+            self._open()
+            logger.info(f"Merged {len(self.recent)} new Hive accounts into {self.path}")
+            self.recent = []
+        await rpc.run(self.save)
+        return added
+
+
+    def _merge(self, recent: list) -> None:
+        records = (self.records[i] for i in range(len(self.records)))
+        with open(f"{self.path}.tmp", "wb") as f:
+            for record in heapq.merge(records, (_key(name) for name in recent)):
+                f.write(record)
+        os.replace(f"{self.path}.tmp", self.path)
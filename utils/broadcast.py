@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import struct
+import time
+from binascii import unhexlify
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+
+logger = logging.getLogger("Bot")
+
+# What a node answers when the transaction, or the same vote, is already on chain
+APPLIED = ("duplicate transaction", "identical to this vote", "already voted")
+
+
+
+def already_applied(error: Exception) -> bool:
+    """Whether a broadcast was rejected only because an earlier attempt already made it on chain"""
+    return any(text in str(error).lower() for text in APPLIED)
+
+
+
+class Broadcaster:
+    """Signs transactions with a key parsed once and a cached reference block, so a broadcast is one round trip"""
+    def __init__(self, rpc, wif: str, refresh: float=30, expiration: int=60):
+        self.rpc = rpc
+        self.wif = wif
+        self.key = None
+        self.invalid_key = False
+        self.refresh_every = refresh
+        self.expiration = expiration
+        self.context = None
+        # ECDSA signing is pure Python here, so it gets its own thread off the event loop
+        self.signer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hive-signer")
+
+
+    def _fetch_context(self, hive) -> dict:
+        from beem.block import BlockHeader
+        from beem.utils import formatTimeString
+        props = hive.rpc.get_dynamic_global_properties(api="database")
+        # Reference the block after the last irreversible one, like beem does, so forks can't void the tx
+        lib = int(props["last_irreversible_block_num"])
+        if lib == int(props["head_block_number"]):
+            ref_num, ref_id = lib, props["head_block_id"]
+        else:
+            ref_num, ref_id = lib, BlockHeader(lib + 1, blockchain_instance=hive)["previous"]
+        return {
+            "ref_block_num": ref_num & 0xFFFF,
+            "ref_block_prefix": struct.unpack_from("<I", unhexlify(ref_id), 4)[0],
+            "time": formatTimeString(props["time"]).replace(tzinfo=None),
+            "fetched": time.monotonic(),
+            "chain": hive.chain_params,
+            "prefix": hive.prefix,
+        }
+
+
+    def _load_key(self):
+        # beemgraphenebase and ecdsa are only imported once there is something to sign, after the gateway is ready
+        if self.key is None and not self.invalid_key:
+            from beemgraphenebase.account import PrivateKey
+            try:
+                self.key = PrivateKey(self.wif)
+            except Exception:
+                self.invalid_key = True
+                logger.critical("The ACC_WIF posting key in config.json is not a valid private key, votes can't be signed!")
+        return self.key
+
+
+    async def refresh(self) -> None:
+        self.context = await self.rpc.hive(self._fetch_context)
+        if self.key is None and not self.invalid_key:
+            # Parsed ahead of the first vote, which also reports a bad key soon after startup
+            await asyncio.get_running_loop().run_in_executor(self.signer, self._load_key)
+
+
+    @property
+    def stale(self) -> bool:
+        return self.context is None or time.monotonic() - self.context["fetched"] > self.refresh_every * 2
+
+
+    def _sign(self, ops: list, context: dict) -> dict:
+        key = self._load_key()
+        if key is None:
+            raise ValueError("Invalid posting key")
+        from beembase.objects import Operation
+        from beembase.signedtransactions import Signed_Transaction
+        # Expire relative to chain time, projected forward from when the context was read
+        now = context["time"] + timedelta(seconds=time.monotonic() - context["fetched"])
+        tx = Signed_Transaction(
+            ref_block_num=context["ref_block_num"],
+            ref_block_prefix=context["ref_block_prefix"],
+            expiration=(now + timedelta(seconds=self.expiration)).replace(microsecond=0).isoformat(),
+            operations=[Operation(op, appbase=False, prefix=context["prefix"]) for op in ops],
+            prefix=context["prefix"]
+        )
+        tx.sign([key], chain=context["chain"])
+        return tx.json()
+
+
+    def _send(self, hive, tx: dict) -> None:
+        hive.rpc.broadcast_transaction(tx, api="condenser")
+
+
+    async def send(self, tx: dict) -> None:
+        await self.rpc.hive(self._send, tx)
+
+
+    async def sign(self, ops: list) -> dict:
+        if self.stale:
+            await self.refresh()
+        return await asyncio.get_running_loop().run_in_executor(self.signer, self._sign, ops, self.context)
+
+
+    async def broadcast(self, ops: list) -> dict:
+        tx = await self.sign(ops)
+        await self.send(tx)
+        return tx
+
+
+    def close(self) -> None:
+        self.signer.shutdown(wait=False)
@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+
+logger = logging.getLogger("Bot")
+
+DAY = 86400
+
+
+
+class Rollup:
+    """Curation results of one time bucket, counted overall, by curator and by voted author"""
+    __slots__ = ("results", "curators", "authors")
+
+    def __init__(self, data: dict | None=None):
+        data = data or {}
+        self.results = Counter(data.get("results", {}))
+        self.curators = {k: Counter(v) for k, v in data.get("curators", {}).items()}
+        self.authors = {k: Counter(v) for k, v in data.get("authors", {}).items()}
+
+
+    def add(self, result: str, curator: str, author: str, weight: float) -> None:
+        tallies = [self.results, self.curators.setdefault(curator, Counter())]
+        if result == "cast":
+            tallies.append(self.authors.setdefault(author, Counter()))
+        for tally in tallies:
+            tally[result] += 1
+            tally["weight"] += weight
+
+
+    def merge(self, other: "Rollup") -> "Rollup":
+        self.results.update(other.results)
+        for mine, theirs in ((self.curators, other.curators), (self.authors, other.authors)):
+            for key, tally in theirs.items():
+                mine.setdefault(key, Counter()).update(tally)
+        return self
+
+
+    def trim(self, top: int) -> None:
+        # Authors are the only unbounded key, so older buckets only keep the most voted ones
+        if len(self.authors) > top:
+            self.authors = dict(sorted(self.authors.items(), key=lambda item: (-item[1]["cast"], -item[1]["weight"]))[:top])
+
+
+    def to_dict(self) -> dict:
+        return {"results": self.results, "curators": self.curators, "authors": self.authors}
+
+
+
+class CurationHistory:
+    """Every curated submission in an append-only log, with running per day and per month rollups.
+
+    Each record is a single line of timestamp, result, curator, post and weight.
+    Results update the rollup of their day as they are written, and days older
+    than the kept window are folded into their month, so questions about any
+    period are answered from at most a few hundred buckets however old the log gets.
+    The rollups are saved next to the log with the log offset they cover, and
+    only the records after that offset are replayed on start.
+    """
+    def __init__(self, path: str="curation.log", days: int=90, top_authors: int=100):
+        self.path = path
+        self.snapshot = f"{os.path.splitext(path)[0]}.json"
+        self.keep = max(int(days), 1)
+        self.top_authors = top_authors
+        self.days = {}
+        self.months = {}
+        self.offset = 0
+        self.load()
+
+
+    def load(self) -> None:
+        try:
+            with open(self.snapshot, "r") as f:
+                data = json.load(f)
+            self.days = {int(k): Rollup(v) for k, v in data.get("days", {}).items()}
+            self.months = {k: Rollup(v) for k, v in data.get("months", {}).items()}
+            self.offset = data.get("offset", 0)
+        except (FileNotFoundError, ValueError):
+            pass
+        try:
+            with open(self.path, "rb") as f:
+                if f.seek(0, os.SEEK_END) < self.offset:
+                    # The log was replaced, so the snapshot no longer matches it
+                    self.days, self.months, self.offset = {}, {}, 0
+                f.seek(self.offset)
+                replayed = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self.offset += len(line)
+                    try:
+                        ts, result, curator, post, weight = line.decode().split()
+                        self._apply(float(ts), result, curator, post.split("/", 1)[0], float(weight))
+                        replayed += 1
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return
+        if replayed:
+            logger.info(f"Replayed {replayed} curation records from {self.path}")
+            self.save()
+
+
+    def save(self) -> None:
+        data = {
+            "offset": self.offset,
+            "days": {day: rollup.to_dict() for day, rollup in self.days.items()},
+            "months": {month: rollup.to_dict() for month, rollup in self.months.items()},
+        }
+        with open(f"{self.snapshot}.tmp", "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(f"{self.snapshot}.tmp", self.snapshot)
+
+
+    def _apply(self, ts: float, result: str, curator: str, author: str, weight: float) -> None:
+        day = int(ts // DAY)
+        rollup = self.days.get(day)
+        if rollup is None:
+            rollup = self.days[day] = Rollup()
+            self._fold(day - self.keep)
+        rollup.add(result, curator, author, weight)
+
+
+    def _fold(self, before: int) -> None:
+        for day in [d for d in self.days if d <= before]:
+            month = time.strftime("%Y-%m", time.gmtime(day * DAY))
+            merged = self.months.setdefault(month, Rollup()).merge(self.days.pop(day))
+            merged.trim(self.top_authors)
+
+
+    def add(self, result: str, curator: str, author: str="", permlink: str="", weight: float=0.0, ts: float | None=None) -> None:
+        """Records one submission's outcome: cast, failed, or the reason it was turned away"""
+        ts = ts or time.time()
+        line = f"{int(ts)} {result} {curator or '-'} {author or '-'}/{permlink or '-'} {weight:g}\n".encode()
+        with open(self.path, "ab") as f:
+            f.write(line)
+        self.offset += len(line)
+        new_day = int(ts // DAY) not in self.days
+        self._apply(ts, result, curator or "-", author or "-", weight)
+        if new_day:
+            self.save()
+
+
+    def period(self, days: int=0) -> Rollup:
+        """Everything recorded in the last given days, or all of it with 0"""
+        total = Rollup()
+        if not days:
+            for rollup in self.months.values():
+                total.merge(rollup)
+        today = int(time.time() // DAY)
+        for day, rollup in self.days.items():
+            if not days or day > today - days:
+                total.merge(rollup)
+        return total
+
+
+    def daily(self, curator: str, days: int=14) -> list:
+        """A curator's votes cast on each of the last given days, oldest first"""
+        today = int(time.time() // DAY)
+        return [self.days[d].curators.get(curator, {}).get("cast", 0) if d in self.days else 0 for d in range(today - days + 1, today + 1)]
+
+
+
+def ranked(tallies: dict, top: int=10) -> list:
+    """(key, tally) pairs with the most votes cast first, then the most weight given"""
+    return sorted(tallies.items(), key=lambda item: (-item[1]["cast"], -item[1]["weight"]))[:top]
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+
+logger = logging.getLogger("Bot")
+
+
+
+class HolderIndex:
+    """Account to balance snapshot of a Hive-Engine token's holders, persisted between restarts"""
+    def __init__(
+        self, rpc, api, symbol: str, balance_type: str, path: str="holders.json",
+        ttl: float=3600, stale_while_revalidate: bool=True, page_size: int=1000, parallel: int=4, metrics=None
+    ):
+        self.rpc = rpc
+        self.metrics = metrics
+        self.api = api
+        self.symbol = symbol
+        self.balance_type = balance_type
+        self.path = path
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.page_size = page_size
+        self.parallel = max(int(parallel), 1)
+        self.balances = {}
+        self.updated = 0.0
+        self.task = None
+        self.load()
+
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("symbol") == self.symbol and data.get("type") == self.balance_type:
+            self.balances = data.get("holders", {})
+            self.updated = data.get("updated", 0.0)
+
+
+    def save(self, balances: dict, updated: float) -> None:
+        data = {"symbol": self.symbol, "type": self.balance_type, "updated": updated, "holders": balances}
+        # Write to a temporary file first so a crash never leaves a truncated snapshot
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.updated > self.ttl
+
+
+    def _fetch_page(self, offset: int) -> list:
+        return self.api.find("tokens", "balances", query={"symbol": self.symbol}, limit=self.page_size, offset=offset) or []
+
+
+    async def fetch(self) -> dict:
+        """Pages through every holder, several pages at a time"""
+        balances, offset = {}, 0
+        while True:
+            pages = await asyncio.gather(*(
+                self.rpc.run(self._fetch_page, offset + i * self.page_size) for i in range(self.parallel)
+            ))
+            for page in pages:
+                for x in page:
+                    amount = float(x.get(self.balance_type, 0) or 0)
+                    if amount > 0:
+                        balances[x['account']] = amount
+            if any(len(page) < self.page_size for page in pages):
+                return balances
+            offset += self.parallel * self.page_size
+
+
+    async def _refresh(self) -> dict:
+        start = time.perf_counter()
+        balances = await self.fetch()
+        self.balances, self.updated = balances, time.time()
+        await self.rpc.run(self.save, dict(balances), self.updated)
+        elapsed = time.perf_counter() - start
+        if self.metrics is not None:
+            # Timed here so refreshes started in the background by get() are counted too
+            self.metrics.observe("holder_refresh_seconds", elapsed, token=self.symbol)
+        logger.info(f"Indexed {len(balances)} {self.symbol} holders in {elapsed:.1f}s")
+        return balances
+
+
+    def _start(self) -> asyncio.Task:
+        # Callers that ask while a refresh is already running share its result
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._refresh())
+            self.task.add_done_callback(self._log_failure)
+        return self.task
+
+
+    def _log_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logger.error(f"Refreshing {self.symbol} holders failed: {task.exception()}")
+
+
+    async def refresh(self) -> dict:
+        return await asyncio.shield(self._start())
+
+
+    async def get(self, account: str) -> float:
+        if self.stale:
+            # Only a full snapshot may be served stale, balances from sidechain events alone miss every other holder
+            if self.updated and self.stale_while_revalidate:
+                self._start()
+            else:
+                await self.refresh()
+        return self.balances.get(account, 0.0)
+
+
+    def _fetch_accounts(self, accounts: list) -> dict:
+        balances = {}
+        for i in range(0, len(accounts), self.page_size):
+            chunk = accounts[i:i + self.page_size]
+            rows = self.api.find("tokens", "balances", query={"symbol": self.symbol, "account": {"$in": chunk}}, limit=self.page_size) or []
+            balances.update({x['account']: float(x.get(self.balance_type, 0) or 0) for x in rows})
+        return balances
+
+
+    async def update_accounts(self, accounts) -> dict:
+        """Re-reads only the given accounts, returning those whose balance changed as {account: (old, new)}"""
+        accounts = sorted(accounts)
+        if not accounts:
+            return {}
+        if not self.updated:
+            # Without a full snapshot to patch, take one, which already holds these accounts' new balances
+            await self.refresh()
+            return {}
+        fresh = await self.rpc.run(self._fetch_accounts, accounts)
+        changed = {}
+        for acc in accounts:
+            old, new = self.balances.get(acc, 0.0), fresh.get(acc, 0.0)
+            if old == new:
+                continue
+            changed[acc] = (old, new)
+            if new > 0:
+                self.balances[acc] = new
+            else:
+                self.balances.pop(acc, None)
+        if changed:
+            await self.rpc.run(self.save, dict(self.balances), self.updated)
+        return changed
+
+
+    def eligible(self, minimum: float) -> dict:
+        return {k: v for k, v in self.balances.items() if v >= minimum}
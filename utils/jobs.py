@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import sqlite3
+import time
+
+import discord
+
+
+logger = logging.getLogger("Bot")
+
+
+
+class CurationQueue:
+    """Durable queue of dropped links, worked through by a fixed pool of async workers.
+
+    A link stays in the database until its curation finishes, so anything still
+    pending at shutdown is picked up again on the next start.
+    """
+    def __init__(self, bot, handler, path: str="bot.db", workers: int=4, max_pending: int=100, metrics=None, labels: dict | None=None):
+        self.bot = bot
+        self.handler = handler
+        self.metrics = metrics
+        self.labels = labels or {}
+        self.workers = max(int(workers), 1)
+        self.max_pending = max_pending
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY, channel_id INTEGER, message_id INTEGER, added REAL)")
+        self.queue = asyncio.Queue()
+        self.queued_at = {}
+        self.messages = {}
+        self.waiting = set()
+        self.deferred = {}
+        self.tasks = []
+        self.busy = 0
+        self.closing = False
+        # Links left over from the last run are queued before put() can add any new ones
+        for job in self.conn.execute("SELECT id, channel_id, message_id FROM queue ORDER BY id"):
+            self.queue.put_nowait(job)
+
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() + self.busy
+
+
+    def start(self) -> None:
+        if self.tasks:
+            return
+        resumed = self.queue.qsize() - len(self.messages)
+        if resumed:
+            logger.info(f"Resuming {resumed} queued curations")
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+
+    async def put(self, message: discord.Message) -> bool:
+        if self.closing or self.depth >= self.max_pending:
+            if self.metrics is not None:
+                self.metrics.inc("curation_rejected_total", reason="queue_full", **self.labels)
+            await self._react(message, "⛔")
+            return False
+        cur = self.conn.execute("INSERT INTO queue (channel_id, message_id, added) VALUES (?, ?, ?)", (message.channel.id, message.id, time.time()))
+        self.messages[cur.lastrowid] = message
+        self.queued_at[cur.lastrowid] = time.perf_counter()
+        if not self.tasks or self.busy + self.queue.qsize() >= self.workers:
+            # Every worker is taken, so let the curator know the link is waiting its turn
+            self.waiting.add(cur.lastrowid)
+            await self._react(message, "⏳")
+        self.queue.put_nowait((cur.lastrowid, message.channel.id, message.id))
+        return True
+
+
+    async def worker(self) -> None:
+        while True:
+            job_id, channel_id, message_id = await self.queue.get()
+            self.busy += 1
+            queued = self.queued_at.pop(job_id, None)
+            if self.metrics is not None and queued is not None:
+                self.metrics.observe("curation_queue_wait_seconds", time.perf_counter() - queued, **self.labels)
+            try:
+                message = self.messages.pop(job_id, None) or await self._fetch(channel_id, message_id)
+                keep = False
+                if message:
+                    start = time.perf_counter()
+                    keep = await self.handler(message)
+                    if self.metrics is not None:
+                        self.metrics.observe("curation_seconds", time.perf_counter() - start, **self.labels)
+                    if job_id in self.waiting or any(r.me and str(r.emoji) == "⏳" for r in message.reactions):
+                        await self._unreact(message, "⏳")
+                if keep is True:
+                    # The handler finishes this link later on and calls finish() when it does
+                    self.deferred[message.id] = job_id
+                else:
+                    self.conn.execute("DELETE FROM queue WHERE id = ?", (job_id,))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Curation of message {message_id} failed: {e}")
+                self.conn.execute("DELETE FROM queue WHERE id = ?", (job_id,))
+            finally:
+                self.waiting.discard(job_id)
+                self.busy -= 1
+                self.queue.task_done()
+
+
+    def finish(self, message_id: int) -> None:
+        job_id = self.deferred.pop(message_id, None)
+        if job_id is not None:
+            self.conn.execute("DELETE FROM queue WHERE id = ?", (job_id,))
+
+
+    async def _fetch(self, channel_id: int, message_id: int) -> discord.Message | None:
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return None
+        try:
+            return await channel.fetch_message(message_id)
+        except discord.NotFound:
+            return None
+
+
+    async def _react(self, message: discord.Message, emoji: str) -> None:
+        try:
+            await message.add_reaction(emoji)
+        except discord.HTTPException:
+            pass
+
+
+    async def _unreact(self, message: discord.Message, emoji: str) -> None:
+        try:
+            await message.remove_reaction(emoji, self.bot.user)
+        except discord.HTTPException:
+            pass
+
+
+    async def close(self, timeout: float=30) -> None:
+        """Stops taking new links and gives the workers a chance to drain the queue"""
+        self.closing = True
+        if self.tasks:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.info(f"{self.depth} curations left queued for the next start")
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            self.tasks = []
+        self.conn.close()
@@ -0,0 +1,111 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+
+logger = logging.getLogger("Bot")
+
+# account_history operation filter bit for vote_operation (op id 0)
+VOTE_FILTER = 1 << 0
+
+
+
+class VoteLedger:
+    """Posts the curation account has voted within the payout window, kept on disk as one line per vote"""
+    def __init__(self, path: str="votes.log", window: int=7 * 86400):
+        self.path = path
+        self.window = window
+        self.votes = {}
+        # The account whose vote history seeded the ledger, kept apart since any cast vote creates the log itself
+        self.state_path = f"{os.path.splitext(path)[0]}.json"
+        self.backfilled = None
+        try:
+            with open(self.state_path, "r") as f:
+                self.backfilled = json.load(f).get("backfilled")
+        except (FileNotFoundError, ValueError):
+            pass
+        self.load()
+
+
+    def load(self) -> None:
+        cutoff = time.time() - self.window
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        ts, authorperm, curator = line.rstrip("\n").split(" ", 2)
+                        author, permlink = authorperm.split("/", 1)
+                    except ValueError:
+                        continue
+                    if float(ts) >= cutoff:
+                        self.votes[(author, permlink)] = (float(ts), curator)
+        except FileNotFoundError:
+            return
+        self.compact()
+
+
+    def compact(self) -> None:
+        """Rewrites the file with only the votes still inside the window"""
+        with open(f"{self.path}.tmp", "w") as f:
+            for (author, permlink), (ts, curator) in self.votes.items():
+                f.write(f"{int(ts)} {author}/{permlink} {curator}\n")
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+    def add(self, author: str, permlink: str, curator: str="", ts: float | None=None) -> None:
+        ts = ts or time.time()
+        self.votes[(author, permlink)] = (ts, curator)
+        with open(self.path, "a") as f:
+            f.write(f"{int(ts)} {author}/{permlink} {curator}\n")
+
+
+    def __contains__(self, key: tuple) -> bool:
+        vote = self.votes.get(key)
+        return vote is not None and vote[0] >= time.time() - self.window
+
+
+    def count(self, curator: str, since: float) -> int:
+        return sum(1 for ts, c in self.votes.values() if c == curator and ts >= since)
+
+
+    def _history(self, hive, account: str) -> list:
+        votes, start = [], -1
+        cutoff = time.time() - self.window
+        while True:
+            # Nodes turn away a page that would reach below index 0, so the last one is cut short
+            history = hive.rpc.get_account_history({
+                'account': account, 'start': start, 'limit': 1000 if start < 0 else min(1000, start + 1),
+                'operation_filter_low': VOTE_FILTER, 'operation_filter_high': 0
+            }, api="account_history")["history"]
+            for index, item in history:
+                op = item['op']
+                op = op['value'] if isinstance(op, dict) else op[1]
+                ts = datetime.fromisoformat(item['timestamp']).replace(tzinfo=timezone.utc).timestamp()
+                if op.get('voter') == account and ts >= cutoff:
+                    votes.append((op['author'], op['permlink'], ts))
+            if not history or history[0][0] <= 0:
+                return votes
+            if datetime.fromisoformat(history[0][1]['timestamp']).replace(tzinfo=timezone.utc).timestamp() < cutoff:
+                return votes
+            start = history[0][0] - 1
+
+
+    def save_state(self) -> None:
+        with open(f"{self.state_path}.tmp", "w") as f:
+            json.dump({"backfilled": self.backfilled}, f)
+        os.replace(f"{self.state_path}.tmp", self.state_path)
+
+
+    async def backfill(self, rpc, account: str) -> None:
+        """Seeds the ledger once from the account's own vote history"""
+        if self.backfilled == account:
+            return
+        for author, permlink, ts in sorted(await rpc.hive(self._history, account), key=lambda v: v[2]):
+            if (author, permlink) not in self.votes:
+                self.votes[(author, permlink)] = (ts, "")
+        self.compact()
+        self.backfilled = account
+        self.save_state()
+        logger.info(f"Backfilled {len(self.votes)} votes of @{account} into {self.path}")
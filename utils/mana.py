@@ -0,0 +1,77 @@
+import heapq
+import itertools
+import time
+
+
+# beem.constants.HIVE_VOTE_REGENERATION_SECONDS, kept here so beem only loads when mana is read
+HIVE_VOTE_REGENERATION_SECONDS = 432000
+
+
+class ManaTracker:
+    """Cached voting mana of the curation account, projected forward between refreshes"""
+    def __init__(self, rpc, account: str, refresh: float=300):
+        self.rpc = rpc
+        self.account = account
+        self.refresh = refresh
+        self.pct = 100.0
+        self.read_at = None
+
+
+    def _fetch(self, hive) -> float:
+        from beem.account import Account
+        return Account(self.account, blockchain_instance=hive).get_manabar()['current_mana_pct']
+
+
+    def projected(self) -> float:
+        """Mana right now, from the last reading plus what has regenerated since"""
+        if self.read_at is None:
+            return self.pct
+        regen = (time.monotonic() - self.read_at) / HIVE_VOTE_REGENERATION_SECONDS * 100
+        return min(self.pct + regen, 100.0)
+
+
+    async def current(self) -> float:
+        if self.read_at is None or time.monotonic() - self.read_at > self.refresh:
+            self.pct = await self.rpc.hive(self._fetch)
+            self.read_at = time.monotonic()
+        return self.projected()
+
+
+    def spend(self, weight: float) -> None:
+        """Takes a cast vote off the cached reading, a full vote using 2% of the mana bar"""
+        self.pct = self.projected() - cost(weight)
+        self.read_at = time.monotonic()
+
+
+    def eta(self, target: float) -> float:
+        """Seconds until mana regenerates to target"""
+        return max(target - self.projected(), 0) / 100 * HIVE_VOTE_REGENERATION_SECONDS
+
+
+
+def cost(weight: float) -> float:
+    return 2 * weight / 100
+
+
+
+class HeldVotes:
+    """Votes waiting for mana, highest curator stake first, then the post closest to leaving the curation window"""
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+
+    def push(self, stake: float, deadline: float, weight: float, entry) -> float:
+        """Holds a vote and returns how much mana the votes ahead of it will use first"""
+        priority = (-stake, deadline)
+        ahead = sum(cost(w) for p, _, w, _ in self.heap if p < priority)
+        heapq.heappush(self.heap, (priority, next(self.counter), weight, entry))
+        return ahead
+
+
+    def pop(self):
+        return heapq.heappop(self.heap)[3]
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import discord
+
+
+logger = logging.getLogger("Bot")
+
+
+
+class MemberCache:
+    """Small LRU of guild members fetched on demand, for when discord.py's own member cache is off.
+
+    Lookups of a handful of members go through fetch_member one by one, while
+    resolving many at once streams the member list and keeps only the ones asked for.
+    """
+    def __init__(self, size: int=1000, ttl: float=300, scan_over: int=50, concurrency: int=5):
+        self.size = size
+        self.ttl = ttl
+        self.scan_over = scan_over
+        self.concurrency = max(int(concurrency), 1)
+        self.cache = OrderedDict()
+
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+
+    def _hit(self, guild: discord.Guild, member_id: int) -> discord.Member | None:
+        # Keyed by guild as well, a member of several of the bot's servers has other roles in each
+        key = (guild.id, member_id)
+        hit = self.cache.get(key)
+        if hit is None or hit[0] < time.monotonic():
+            return None
+        self.cache.move_to_end(key)
+        return hit[1]
+
+
+    def put(self, member: discord.Member) -> None:
+        key = (member.guild.id, member.id)
+        self.cache[key] = (time.monotonic() + self.ttl, member)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+
+    def forget(self, member: discord.Member) -> None:
+        # A role change makes the cached copy's roles out of date
+        self.cache.pop((member.guild.id, member.id), None)
+
+
+    async def _fetch(self, guild: discord.Guild, member_id: int) -> discord.Member | None:
+        try:
+            member = await guild.fetch_member(member_id)
+        except discord.NotFound:
+            return None
+        except discord.HTTPException as e:
+            # One member Discord won't return is left out, and the reconcile skips them this time
+            logger.warning(f"Couldn't fetch member {member_id}: {e}")
+            return None
+        self.put(member)
+        return member
+
+
+    async def resolve(self, guild: discord.Guild, member_ids) -> dict:
+        """Looks up many members at once, returning {member_id: member} for those still in the guild"""
+        found, missing = {}, set()
+        for member_id in member_ids:
+            member = guild.get_member(member_id) or self._hit(guild, member_id)
+            if member is None:
+                missing.add(member_id)
+            else:
+                found[member_id] = member
+        if len(missing) > self.scan_over:
+            # Paging through the member list takes far fewer requests than fetching each one
+            try:
+                async for member in guild.fetch_members(limit=None):
+                    if member.id in missing:
+                        found[member.id] = member
+            except discord.HTTPException as e:
+                logger.warning(f"Couldn't page through the member list, {len(missing - found.keys())} members are skipped: {e}")
+        elif missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def fetch(member_id: int) -> None:
+                async with semaphore:
+                    member = await self._fetch(guild, member_id)
+                if member is not None:
+                    found[member_id] = member
+            await asyncio.gather(*(fetch(member_id) for member_id in missing))
+        return found
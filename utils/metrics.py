@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+logger = logging.getLogger("Bot")
+
+# Upper bounds in seconds, from a fast cache hit up to a slow full holder refresh
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+
+class Histogram:
+    """Fixed bucket latency histogram, cheap enough to update on every call"""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile by interpolating inside the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                low = BUCKETS[i - 1] if i else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+
+class Metrics:
+    """In-process latency histograms, counters and gauges, readable by /stats or as Prometheus text"""
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.monotonic()
+        # RPC timings are recorded from the worker threads
+        self.lock = threading.Lock()
+
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+
+    def inc(self, name: str, amount: int=1, **labels) -> None:
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+
+    def gauge(self, name: str, func, **labels) -> None:
+        """Registers a callable that is read whenever the metrics are reported"""
+        self.gauges[(name, tuple(labels.items()))] = func
+
+
+    @property
+    def uptime(self) -> float:
+        return time.monotonic() - self.started
+
+
+    def series(self, name: str, **match) -> dict:
+        """Every histogram recorded under name with the given labels, keyed by the values of its other labels"""
+        with self.lock:
+            return _select(self.histograms, name, match)
+
+
+    def count(self, name: str, **match) -> dict:
+        with self.lock:
+            return _select(self.counters, name, match)
+
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, labels), hist in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE hivediscured_{name} histogram")
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), hist.counts):
+                cumulative += n
+                lines.append(f"hivediscured_{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"hivediscured_{name}_sum{_labels(labels)} {hist.sum:.6f}")
+            lines.append(f"hivediscured_{name}_count{_labels(labels)} {hist.count}")
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE hivediscured_{name} counter")
+            lines.append(f"hivediscured_{name}{_labels(labels)} {value}")
+        for (name, labels), func in sorted(self.gauges.items(), key=lambda item: item[0]):
+            try:
+                value = func()
+            except Exception:
+                continue
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE hivediscured_{name} gauge")
+            lines.append(f"hivediscured_{name}{_labels(labels)} {value}")
+        lines.append("# TYPE hivediscured_uptime_seconds gauge")
+        lines.append(f"hivediscured_uptime_seconds {self.uptime:.0f}")
+        return "\n".join(lines) + "\n"
+
+
+    async def serve(self, port: int, host: str="127.0.0.1") -> asyncio.AbstractServer:
+        """Serves the Prometheus text on http://host:port/metrics"""
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            try:
+                request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+                path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+                if path.split(b"?", 1)[0] == b"/metrics":
+                    status, body = "200 OK", self.render().encode()
+                else:
+                    status, body = "404 Not Found", b"Not Found\n"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+        server = await asyncio.start_server(handle, host, port)
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return server
+
+
+
+def _select(values: dict, name: str, match: dict) -> dict:
+    match = set(match.items())
+    return {
+        tuple(v for k, v in labels if (k, v) not in match): value
+        for (n, labels), value in values.items() if n == name and match.issubset(labels)
+    }
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
@@ -0,0 +1,211 @@
+import functools
+import json
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger("Bot")
+
+
+DEFAULT_NODES = [
+    "https://api.hive.blog",
+    "https://api.deathwing.me",
+    "https://api.openhive.network",
+    "https://anyx.io",
+    "https://rpc.mahdiyari.info",
+    "https://hive-api.arcange.eu",
+]
+
+
+@functools.cache
+def node_errors() -> tuple:
+    """Errors that say something about the node rather than about the request"""
+    # Imported on first use, so starting the bot doesn't wait for beem and requests to load
+    import requests
+    from beemapi.exceptions import (
+        CallRetriesReached, NumRetriesReached, RPCConnection, TimeoutException, WorkingNodeMissing
+    )
+    return (
+        CallRetriesReached, NumRetriesReached, RPCConnection, TimeoutException,
+        WorkingNodeMissing, requests.RequestException, ConnectionError, TimeoutError
+    )
+
+
+
+class NodeStats:
+    """Running latency and error rate of a single API node"""
+    __slots__ = ("url", "latency", "errors", "fails", "down_until", "calls")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency = 1.0
+        self.errors = 0.0
+        self.fails = 0
+        self.down_until = 0.0
+        self.calls = 0
+
+
+    def record(self, elapsed: float, ok: bool, alpha: float=0.2) -> None:
+        self.calls += 1
+        if ok:
+            self.latency += alpha * (elapsed - self.latency)
+            self.errors -= alpha * self.errors
+            self.fails, self.down_until = 0, 0.0
+        else:
+            self.errors += alpha * (1 - self.errors)
+            self.fails += 1
+            # Back off a failing node for longer each time it fails in a row
+            self.down_until = time.monotonic() + min(30 * 2 ** (self.fails - 1), 600)
+
+
+    @property
+    def score(self) -> float:
+        if self.down_until > time.monotonic():
+            return float("inf")
+        return self.latency * (1 + 10 * self.errors)
+
+
+
+class NodePool:
+    """Long-lived Hive clients that send every request to the healthiest node"""
+    def __init__(self, nodes: list | None=None, timeout: int=10, workers: int=8, metrics=None):
+        self.timeout = timeout
+        self.metrics = metrics
+        self.workers = max(workers, 1)
+        self.stats = {url: NodeStats(url) for url in (nodes or DEFAULT_NODES)}
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._session = None
+
+
+    @property
+    def session(self):
+        if self._session is None:
+            from requests.adapters import HTTPAdapter
+            from beemapi.graphenerpc import shared_session_instance
+            with self.lock:
+                if self._session is None:
+                    # beem sends every HTTP request through one shared session, so sizing its
+                    # connection pool to the worker count keeps a warm keep-alive socket per thread
+                    session = shared_session_instance()
+                    adapter = HTTPAdapter(pool_connections=len(self.stats), pool_maxsize=self.workers)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+
+    def ranked(self) -> list:
+        with self.lock:
+            return [s.url for s in sorted(self.stats.values(), key=lambda s: s.score)]
+
+
+    def record(self, url: str, elapsed: float, ok: bool) -> None:
+        if self.metrics is not None:
+            self.metrics.observe("rpc_seconds", elapsed, node=url, ok=str(ok).lower())
+        with self.lock:
+            stats = self.stats.get(url)
+            if stats is None:
+                return
+            stats.record(elapsed, ok)
+            first_fail = stats.fails == 1
+        if first_fail:
+            logger.warning(f"Hive node {url} failed, skipping it for a while")
+
+
+    def _should_switch(self, url: str) -> bool:
+        # Only move away from the current node when another one is clearly healthier,
+        # so that small latency jitter doesn't cause a reconnect on every call
+        with self.lock:
+            best = min(self.stats.values(), key=lambda s: s.score)
+            current = self.stats.get(url)
+            return current is None or current.score > best.score * 1.5
+
+
+    @property
+    def hive(self):
+        """The calling thread's client, pointed at the healthiest node"""
+        hive = getattr(self._local, "hive", None)
+        if hive is None:
+            from beem import Hive
+            # Mounts the pooled adapter before beem sends its first request
+            self.session
+            hive = Hive(node=self.ranked(), num_retries=2, num_retries_call=1, timeout=self.timeout)
+            self._local.hive = hive
+        elif self._should_switch(hive.rpc.url):
+            self._switch(hive)
+        return hive
+
+
+    def _switch(self, hive) -> None:
+        hive.rpc.nodes.set_node_urls(self.ranked())
+        hive.rpc.rpcconnect()
+
+
+    def call(self, func, *args, **kwargs):
+        """Runs func(hive, *args, **kwargs), failing over once if the node misbehaves"""
+        hive = self.hive
+        for attempt in range(2):
+            url = hive.rpc.url
+            start = time.perf_counter()
+            try:
+                result = func(hive, *args, **kwargs)
+            except node_errors():
+                self.record(url, time.perf_counter() - start, False)
+                if attempt:
+                    raise
+                self._switch(hive)
+                continue
+            if hive.rpc.url != url:
+                # beem failed over on its own in the middle of the call
+                self.record(url, time.perf_counter() - start, False)
+            self.record(hive.rpc.url, time.perf_counter() - start, True)
+            return result
+
+
+    def batch(self, calls: list, size: int=50) -> list:
+        """Sends (method, params) JSON-RPC calls batched into as few HTTP requests as nodes accept.
+
+        Returns each call's result in order, with None for a call the node answered with an error.
+        """
+        results = []
+        for i in range(0, len(calls), size):
+            payload = json.dumps([
+                {"jsonrpc": "2.0", "method": method, "params": params, "id": n}
+                for n, (method, params) in enumerate(calls[i:i + size])
+            ])
+            for attempt, url in enumerate(self.ranked()[:2]):
+                start = time.perf_counter()
+                try:
+                    response = self.session.post(url, data=payload, timeout=self.timeout)
+                    response.raise_for_status()
+                    replies = response.json()
+                    if not isinstance(replies, list):
+                        raise ConnectionError(f"{url} doesn't take batched requests")
+                except (*node_errors(), ValueError):
+                    self.record(url, time.perf_counter() - start, False)
+                    if attempt:
+                        raise
+                    continue
+                self.record(url, time.perf_counter() - start, True)
+                replies = {reply.get("id"): reply.get("result") for reply in replies}
+                results += [replies.get(n) for n in range(len(calls[i:i + size]))]
+                break
+            else:
+                # With a single node there's no second one to fail over to
+                raise ConnectionError("No Hive node answered the batched request")
+        return results
+
+
+    def probe(self) -> None:
+        """Measures every node with a cheap request, which also brings recovered nodes back"""
+        payload = json.dumps({"jsonrpc": "2.0", "method": "condenser_api.get_dynamic_global_properties", "params": [], "id": 1})
+        for url in list(self.stats):
+            start = time.perf_counter()
+            try:
+                response = self.session.post(url, data=payload, timeout=self.timeout)
+                ok = response.status_code == 200 and "result" in response.json()
+            except Exception:
+                ok = False
+            self.record(url, time.perf_counter() - start, ok)
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+# A link to a post or comment on any Hive frontend, down to the permlink or the comment anchor after it
+LINK = re.compile(r"https?://[^\s<>/]+/(?:[^\s<>@]*/)?@[a-z0-9.-]+/[^\s<>()\[\]|*]+", re.IGNORECASE)
+
+
+
+def parse_link(link: str) -> tuple:
+    """Pulls a normalized (author, permlink) out of a post or comment link"""
+    author, permlink = link.split('@', 1)[1].split('/', 1)
+    if '#@' in permlink:
+        author, permlink = permlink.split('#@', 1)[1].split('/', 1)
+    permlink = permlink.split('?', 1)[0].split('#', 1)[0].strip('/')
+    author = author.strip(' @').lower()
+    if not author or not permlink:
+        raise ValueError(f"Not a post link: {link}")
+    return author, permlink
+
+
+def find_links(content: str, limit: int | None=None) -> list:
+    """Every distinct post link in a message as (link, (author, permlink)), in the order they appear"""
+    links = {}
+    for link in LINK.findall(content):
+        link = link.rstrip(".,!?;:'\"")
+        try:
+            key = parse_link(link)
+        except (ValueError, IndexError):
+            continue
+        links.setdefault(key, link)
+    return [(link, key) for key, link in links.items()][:limit]
+
+
+
+class PostInfo:
+    """The parts of a post that curate needs, read from a node's get_content reply"""
+    __slots__ = ("author", "permlink", "title", "tags", "main_post", "created", "image", "reward")
+
+    def __init__(self, content: dict):
+        self.author = content['author']
+        self.permlink = content['permlink']
+        self.title = content.get('title', '')
+        metadata = content.get('json_metadata') or {}
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except ValueError:
+                metadata = {}
+        metadata = metadata if isinstance(metadata, dict) else {}
+        self.tags = metadata.get('tags', [])
+        self.main_post = not content.get('parent_author')
+        self.created = datetime.fromisoformat(content['created']).replace(tzinfo=timezone.utc)
+        images = metadata.get('image', metadata.get('images', []))
+        self.image = images[0] if isinstance(images, list) and images else None
+        paid = ('total_payout_value', 'curator_payout_value', 'pending_payout_value')
+        self.reward = f"{sum(float(str(content.get(k) or '0').split()[0]) for k in paid):.3f} HBD"
+
+
+
+class PostCache:
+    """LRU cache of recently fetched posts.
+
+    Posts that aren't cached are fetched together in one batched request, and
+    concurrent lookups of one post share a single fetch.
+    """
+    def __init__(self, rpc, size: int=512, ttl: float=60):
+        self.rpc = rpc
+        self.size = size
+        self.ttl = ttl
+        self.cache = OrderedDict()
+        self.inflight = {}
+
+
+    def _fetch(self, keys: list) -> dict:
+        replies = self.rpc.nodes.batch([("condenser_api.get_content", [author, permlink]) for author, permlink in keys])
+        # A post that doesn't exist comes back empty, or with an empty author
+        return {key: PostInfo(reply) if reply and reply.get('author') else None for key, reply in zip(keys, replies)}
+
+
+    async def get_many(self, keys) -> dict:
+        """{(author, permlink): post, or None when it doesn't exist} for every key"""
+        found, waiting, missing = {}, {}, []
+        for key in dict.fromkeys(keys):
+            hit = self.cache.get(key)
+            if hit and hit[0] > time.monotonic():
+                self.cache.move_to_end(key)
+                found[key] = hit[1]
+            elif key in self.inflight:
+                waiting[key] = self.inflight[key]
+            else:
+                missing.append(key)
+        if missing:
+            task = asyncio.create_task(self._load(missing))
+            for key in missing:
+                self.inflight[key] = waiting[key] = task
+            task.add_done_callback(lambda _: self._landed(missing))
+        for key, task in waiting.items():
+            found[key] = (await asyncio.shield(task)).get(key)
+        return found
+
+
+    def _landed(self, keys: list) -> None:
+        for key in keys:
+            self.inflight.pop(key, None)
+
+
+    async def _load(self, keys: list) -> dict:
+        posts = await self.rpc.run(self._fetch, keys)
+        for key, post in posts.items():
+            if post is None:
+                continue
+            self.cache[key] = (time.monotonic() + self.ttl, post)
+            self.cache.move_to_end(key)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return posts
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+
+logger = logging.getLogger("Bot")
+
+
+
+class RoleStats:
+    """Outcome counts of one role reconcile run"""
+    def __init__(self):
+        self.added = 0
+        self.removed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+
+    def __str__(self) -> str:
+        return f"added {self.added}, removed {self.removed}, skipped {self.skipped}, failed {self.failed} in {self.elapsed:.1f}s"
+
+
+
+def role_delta(guild: discord.Guild, role: discord.Role, links: dict, permitted, members: dict | None=None) -> tuple:
+    """Works out from the member cache which linked members need the role added or removed"""
+    add, remove, skipped = [], [], 0
+    lookup = guild.get_member if members is None else members.get
+    for discord_id, acc in links.items():
+        member = lookup(int(discord_id))
+        if member is None:
+            skipped += 1
+            continue
+        has_role = role in member.roles
+        if acc in permitted and not has_role:
+            add.append(member)
+        elif acc not in permitted and has_role:
+            remove.append(member)
+        else:
+            skipped += 1
+    return add, remove, skipped
+
+
+
+async def reconcile_roles(guild: discord.Guild, role: discord.Role, links: dict, permitted, concurrency: int=5, members=None) -> RoleStats:
+    """Grants or removes the role only where it has to change.
+
+    Requests run concurrently, discord.py's HTTP client queues them on Discord's
+    per-route rate limit buckets, and the semaphore only caps how many wait at once.
+    With a MemberCache as members, only the linked members are looked up instead
+    of chunking the whole guild.
+    """
+    stats, start = RoleStats(), time.perf_counter()
+    resolved = None
+    if members is not None:
+        resolved = await members.resolve(guild, [int(discord_id) for discord_id in links])
+    elif not guild.chunked:
+        await guild.chunk()
+    add, remove, stats.skipped = role_delta(guild, role, links, permitted, resolved)
+    semaphore = asyncio.Semaphore(max(int(concurrency), 1))
+
+    async def apply(member: discord.Member, grant: bool) -> None:
+        async with semaphore:
+            try:
+                if grant:
+                    await member.add_roles(role, reason="Holds enough curation tokens")
+                    stats.added += 1
+                else:
+                    await member.remove_roles(role, reason="No longer holds enough curation tokens")
+                    stats.removed += 1
+                if members is not None:
+                    members.forget(member)
+            except discord.HTTPException as e:
+                stats.failed += 1
+                logger.warning(f"Couldn't update the role of {member}: {e}")
+
+    await asyncio.gather(*[apply(m, True) for m in add], *[apply(m, False) for m in remove])
+    stats.elapsed = time.perf_counter() - start
+    logger.info(f"Role reconcile: {stats}")
+    return stats
@@ -0,0 +1,49 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+class RPCPool:
+    """Bounded worker pool that keeps blocking beem/hiveengine calls off the event loop"""
+    def __init__(self, max_workers: int=8, nodes=None):
+        self.max_workers = max(int(max_workers), 1)
+        self.nodes = nodes
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hive-rpc")
+        self.semaphore = asyncio.Semaphore(self.max_workers)
+
+
+    async def run(self, func, *args, **kwargs):
+        # The semaphore keeps callers waiting on the loop instead of piling up in the executor queue
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+
+    async def hive(self, func, *args, **kwargs):
+        """Runs func(hive, *args, **kwargs) on a worker with that worker's pooled Hive client"""
+        return await self.run(self.nodes.call, func, *args, **kwargs)
+
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+
+
+class RPCShare:
+    """A curation project's share of the RPCPool workers, so one project's burst can't take all of them"""
+    def __init__(self, pool: RPCPool, limit: int):
+        self.pool = pool
+        self.nodes = pool.nodes
+        self.max_workers = min(max(int(limit), 1), pool.max_workers)
+        self.semaphore = asyncio.Semaphore(self.max_workers)
+
+
+    async def run(self, func, *args, **kwargs):
+        async with self.semaphore:
+            return await self.pool.run(func, *args, **kwargs)
+
+
+    async def hive(self, func, *args, **kwargs):
+        return await self.run(self.nodes.call, func, *args, **kwargs)
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+
+
+logger = logging.getLogger("Bot")
+
+
+
+class EngineApi:
+    """hiveengine's Api, only imported and created on the first request"""
+    def __init__(self, url: str):
+        self.url = url
+        self.api = None
+
+
+    def __getattr__(self, name: str):
+        if self.api is None:
+            from hiveengine.api import Api
+            self.api = Api(url=self.url)
+        return getattr(self.api, name)
+
+
+
+class EngineBlocks:
+    """Reads Hive-Engine sidechain blocks from an API node.
+
+    Anything with the same latest()/block() methods can stand in for it,
+    such as a local list of recorded blocks.
+    """
+    def __init__(self, api):
+        self.api = api
+
+
+    def latest(self) -> int:
+        return int(self.api.get_latest_block_info()['blockNumber'])
+
+
+    def block(self, number: int) -> dict | None:
+        return self.api.get_block_info(number)
+
+
+
+def touched_accounts(block: dict, symbol: str) -> set:
+    """Accounts whose balance of the token may have changed in a block"""
+    accounts = set()
+    # Virtual transactions are the ones the sidechain runs itself, like pending unstakes paying out
+    for tx in block.get('transactions', []) + block.get('virtualTransactions', []):
+        try:
+            payload = json.loads(tx.get('payload') or "{}")
+            logs = json.loads(tx.get('logs') or "{}")
+        except ValueError:
+            continue
+        if tx.get('contract') == 'tokens' and payload.get('symbol') == symbol and not logs.get('errors'):
+            accounts.update((tx.get('sender'), payload.get('to'), payload.get('from')))
+        # Token events also come from other contracts' transactions, like market trades settling
+        for event in logs.get('events', []):
+            data = event.get('data', {})
+            if event.get('contract') == 'tokens' and data.get('symbol') == symbol:
+                accounts.update((data.get('account'), data.get('from'), data.get('to')))
+    accounts.discard(None)
+    accounts.discard('null')
+    return accounts
+
+
+
+class SidechainFollower:
+    """Follows sidechain blocks from a saved checkpoint and reports which holders they touched"""
+    def __init__(self, rpc, source, symbol: str, path: str="sidechain.json", max_blocks: int=200):
+        self.rpc = rpc
+        self.source = source
+        self.symbol = symbol
+        self.path = path
+        self.max_blocks = max_blocks
+        self.checkpoint = None
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("symbol") == symbol:
+                self.checkpoint = data.get("block")
+        except (FileNotFoundError, ValueError):
+            pass
+
+
+    def save(self) -> None:
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump({"symbol": self.symbol, "block": self.checkpoint}, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+    def _read(self) -> tuple:
+        latest = self.source.latest()
+        start = latest if self.checkpoint is None else self.checkpoint
+        accounts, last = set(), start
+        for number in range(start + 1, min(latest, start + self.max_blocks) + 1):
+            block = self.source.block(number)
+            if not block:
+                break
+            accounts |= touched_accounts(block, self.symbol)
+            last = number
+        return accounts, last
+
+
+    async def poll(self) -> tuple:
+        """Accounts touched since the checkpoint and the last block read, to commit() once they are applied"""
+        return await self.rpc.run(self._read)
+
+
+    async def commit(self, last: int) -> None:
+        # Only moved on after the touched balances are re-read, so a failed read is retried from the same blocks
+        if last != self.checkpoint:
+            self.checkpoint = last
+            await self.rpc.run(self.save)
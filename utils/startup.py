@@ -0,0 +1,35 @@
+import logging
+import sys
+import time
+
+
+logger = logging.getLogger("Bot")
+
+# Libraries that are meant to load only after the gateway is ready
+HEAVY = ("beem", "beembase", "beemgraphenebase", "hiveengine", "requests")
+
+
+
+class StartupProfile:
+    """Times the startup phases, logged as one table when the bot runs with --profile-startup"""
+    def __init__(self, enabled: bool, start: float):
+        self.enabled = enabled
+        self.start = start
+        self.marks = []
+
+
+    def mark(self, phase: str) -> None:
+        if self.enabled:
+            loaded = ",".join(m for m in HEAVY if m in sys.modules) or "-"
+            self.marks.append((phase, time.perf_counter(), loaded))
+
+
+    def report(self) -> None:
+        if not self.enabled or not self.marks:
+            return
+        lines, last = [f"{'phase':<28}{'at s':>8}{'took s':>8}  heavy modules loaded"], self.start
+        for phase, at, loaded in self.marks:
+            lines.append(f"{phase:<28}{at - self.start:>8.3f}{at - last:>8.3f}  {loaded}")
+            last = at
+        logger.info("Startup profile:\n" + "\n".join(lines))
+        self.marks = []
@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+import sqlite3
+from collections.abc import MutableMapping
+
+
+logger = logging.getLogger("Bot")
+
+
+
+class LinkStore(MutableMapping):
+    """Discord user ID to Hive account links, indexed both ways and stored in SQLite.
+
+    Reads come from two in-memory dicts, and every change is committed to the
+    database as a single row write, so a crash can never lose the other links.
+    """
+    def __init__(self, path: str="bot.db", legacy: str="db.json"):
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS links (discord_id TEXT PRIMARY KEY, account TEXT NOT NULL UNIQUE)")
+        self.links = dict(self.conn.execute("SELECT discord_id, account FROM links"))
+        self.owners = {acc: discord_id for discord_id, acc in self.links.items()}
+        if not self.links and os.path.exists(legacy):
+            self.migrate(legacy)
+
+
+    def migrate(self, legacy: str) -> None:
+        """Imports the old db.json once and keeps it around as a backup"""
+        with open(legacy, "r") as f:
+            data = json.load(f)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            for discord_id, acc in data.items():
+                self.conn.execute("DELETE FROM links WHERE account = ?", (acc,))
+                self.conn.execute("INSERT OR REPLACE INTO links VALUES (?, ?)", (str(discord_id), acc))
+        self.links = dict(self.conn.execute("SELECT discord_id, account FROM links"))
+        self.owners = {acc: discord_id for discord_id, acc in self.links.items()}
+        os.replace(legacy, f"{legacy}.bak")
+        logger.info(f"Migrated {len(self.links)} linked accounts from {legacy}")
+
+
+    def __getitem__(self, discord_id: str) -> str:
+        return self.links[discord_id]
+
+
+    def __setitem__(self, discord_id: str, acc: str) -> None:
+        # The newest verified owner of an account replaces any older link to it
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM links WHERE account = ?", (acc,))
+            self.conn.execute("INSERT OR REPLACE INTO links VALUES (?, ?)", (discord_id, acc))
+        self.links.pop(self.owners.pop(acc, None), None)
+        self.owners.pop(self.links.get(discord_id), None)
+        self.links[discord_id] = acc
+        self.owners[acc] = discord_id
+
+
+    def __delitem__(self, discord_id: str) -> None:
+        acc = self.links.pop(discord_id)
+        self.owners.pop(acc, None)
+        self.conn.execute("DELETE FROM links WHERE discord_id = ?", (discord_id,))
+
+
+    def __iter__(self):
+        return iter(self.links)
+
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+
+    def __contains__(self, discord_id) -> bool:
+        return discord_id in self.links
+
+
+    def owner(self, acc: str) -> str | None:
+        """The Discord user ID linked to a Hive account"""
+        return self.owners.get(acc)
+
+
+    def close(self) -> None:
+        self.conn.close()
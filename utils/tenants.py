@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+
+from utils.holders import HolderIndex
+from utils.jobs import CurationQueue
+from utils.rpc import RPCShare
+from utils.sidechain import EngineApi, EngineBlocks, SidechainFollower
+from utils.store import LinkStore
+
+
+
+def tenant_configs(config: dict) -> list:
+    """(settings, folder) of every curation project in config.json.
+
+    Without a TENANTS section the top level is the only project and its files stay
+    where they always were. With one, each guild ID under it is a project whose
+    settings override the shared top level ones, and whose files live in tenants/<guild ID>/.
+    """
+    if "TENANTS" not in config:
+        return [(config, "")]
+    shared = {k: v for k, v in config.items() if k != "TENANTS"}
+    return [
+        ({**shared, **overrides, "GUILD_ID": int(guild_id)}, os.path.join("tenants", str(guild_id)))
+        for guild_id, overrides in config["TENANTS"].items()
+    ]
+
+
+
+class Tenant:
+    """One curation project on the shared client: its guild, settings, linked accounts and curation queue.
+
+    Attributes it doesn't have itself come from the client, so a project's curation
+    runs against its tenant as if it were the whole bot.
+    """
+    def __init__(self, client, config: dict, folder: str="", projects: int=1):
+        self.client = client
+        self.config = config
+        self.folder = folder
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.guild_id = config.get("GUILD_ID", 0)
+        self.role_id = config.get("ROLE_ID", 0)
+        self.chan_id = config.get("CHAN_ID", 0)
+        self.labels = {"guild": str(self.guild_id)} if folder else {}
+        self.db = LinkStore(self.path("bot.db"), legacy=self.path("db.json"))
+        # By default each project gets an even part of the shared RPC workers, so however many burst at once none is starved
+        share = config.get("TENANT_RPC_SHARE", max(client.rpc.max_workers // max(projects, 1), 1))
+        self.rpc = RPCShare(client.rpc, share) if folder else client.rpc
+        self.curation = CurationQueue(
+            self, self.curate, path=self.path("bot.db"), workers=config.get("CURATE_WORKERS", 4),
+            max_pending=config.get("QUEUE_MAX", 100), metrics=client.metrics, labels=self.labels
+        )
+        client.metrics.gauge("curation_queue_depth", lambda: self.curation.depth, **self.labels)
+        self.engine = None
+
+
+    def __getattr__(self, name: str):
+        return getattr(self.client, name)
+
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.folder, name) if self.folder else name
+
+
+    async def curate(self, message) -> bool | None:
+        return await self.engine.curate(message)
+
+
+    def save_config(self) -> None:
+        """Stores the project's role and channel back into config.json"""
+        self.config.update(CHAN_ID=self.chan_id, ROLE_ID=self.role_id)
+        if self.folder:
+            self.client.config["TENANTS"][str(self.guild_id)].update(CHAN_ID=self.chan_id, ROLE_ID=self.role_id)
+        self.client.save_config()
+
+
+
+class TokenFeed:
+    """A token's holder index and sidechain follower, shared by every project curating with that token.
+
+    Each project polls for balance changes on its own schedule and gets every
+    change exactly once, while the sidechain is read once for all of them.
+    """
+    def __init__(self, holders, sidechain, min_interval: float=5):
+        self.holders = holders
+        self.sidechain = sidechain
+        self.min_interval = min_interval
+        self.pending = {}
+        self.polled = 0.0
+        self.task = None
+
+
+    async def _poll(self) -> None:
+        accounts, last = await self.sidechain.poll()
+        changed = await self.holders.update_accounts(accounts)
+        await self.sidechain.commit(last)
+        self.polled = time.monotonic()
+        for queued in self.pending.values():
+            queued.update(changed)
+
+
+    async def poll(self, subscriber) -> dict:
+        """Balance changes since this subscriber last asked, as {account: (old, new)}"""
+        queued = self.pending.setdefault(subscriber, {})
+        if time.monotonic() - self.polled >= self.min_interval:
+            if self.task is None or self.task.done():
+                self.task = asyncio.create_task(self._poll())
+            await asyncio.shield(self.task)
+        changed, self.pending[subscriber] = queued, {}
+        return changed
+
+
+
+class TokenFeeds:
+    """One TokenFeed per token, so projects curating with the same token share its holder index"""
+    def __init__(self, rpc, folder: str="", metrics=None):
+        self.rpc = rpc
+        self.folder = folder
+        self.metrics = metrics
+        self.feeds = {}
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+
+    def get(self, config: dict) -> TokenFeed:
+        url = config.get("ENGINE_API", 'https://api.hive-engine.com/rpc/')
+        symbol, balance_type = config['TOKEN_NAME'], config['TOKEN_TYPE']
+        feed = self.feeds.get((url, symbol, balance_type))
+        if feed is None:
+            api = EngineApi(url)
+            # Shared files are named after their token, a single project keeps the names it always had
+            prefix = os.path.join(self.folder, f"{symbol}.{balance_type}.") if self.folder else ""
+            holders = HolderIndex(
+                self.rpc, api, symbol, balance_type, path=f"{prefix}holders.json",
+                ttl=config.get("HOLDERS_TTL", 3600), stale_while_revalidate=config.get("HOLDERS_SWR", True),
+                metrics=self.metrics
+            )
+            sidechain = SidechainFollower(self.rpc, EngineBlocks(api), symbol, path=f"{prefix}sidechain.json")
+            feed = self.feeds[(url, symbol, balance_type)] = TokenFeed(holders, sidechain)
+        return feed
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+
+logger = logging.getLogger("Bot")
+
+# account_history operation filter bit for transfer_operation (op id 2)
+TRANSFER_FILTER = 1 << 2
+
+
+
+class TransferWatcher:
+    """Short-lived index of incoming transfers to the curation account, keyed by memo.
+
+    One shared poll of the curation account's own history replaces a history
+    scan of every user who clicks Verify.
+    """
+    def __init__(self, rpc, account: str, window: int=600, page_size: int=100):
+        self.rpc = rpc
+        self.account = account
+        self.window = timedelta(seconds=window)
+        self.page_size = page_size
+        self.memos = {}
+        self.last_index = -1
+        self.task = None
+
+
+    def _fetch(self, hive) -> list:
+        """Reads back through the history until it reaches ops already indexed or the window's start"""
+        ops, start = [], -1
+        cutoff = datetime.now(timezone.utc) - self.window
+        while True:
+            history = hive.rpc.get_account_history({
+                'account': self.account, 'start': start, 'limit': self.page_size if start < 0 else min(self.page_size, start + 1),
+                'operation_filter_low': TRANSFER_FILTER, 'operation_filter_high': 0
+            }, api="account_history")["history"]
+            fresh = [h for h in history if h[0] > self.last_index]
+            ops.extend(fresh)
+            if not history or len(fresh) < len(history) or history[0][0] <= 0:
+                return ops
+            if _timestamp(history[0][1]) < cutoff:
+                return ops
+            start = history[0][0] - 1
+
+
+    async def _poll(self) -> None:
+        ops = await self.rpc.hive(self._fetch)
+        for index, item in sorted(ops, key=lambda h: h[0]):
+            self.last_index = max(self.last_index, index)
+            op = item['op']
+            op = op['value'] if isinstance(op, dict) else op[1]
+            if op.get('to') == self.account and op.get('memo'):
+                self.memos.setdefault(op['memo'].strip(), {})[op['from']] = _timestamp(item)
+        self.prune()
+
+
+    def prune(self) -> None:
+        cutoff = datetime.now(timezone.utc) - self.window
+        for memo in list(self.memos):
+            senders = {k: v for k, v in self.memos[memo].items() if v >= cutoff}
+            if senders:
+                self.memos[memo] = senders
+            else:
+                del self.memos[memo]
+
+
+    async def poll(self) -> None:
+        # Every Verify click that lands during a poll waits on that same poll
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._poll())
+        await asyncio.shield(self.task)
+
+
+    def match(self, memo: str, sender: str) -> bool:
+        sent = self.memos.get(memo, {}).get(sender)
+        return sent is not None and sent >= datetime.now(timezone.utc) - self.window
+
+
+    async def verify(self, memo: str, sender: str) -> bool:
+        if self.match(memo, sender):
+            return True
+        await self.poll()
+        return self.match(memo, sender)
+
+
+
+def _timestamp(item: dict) -> datetime:
+    return datetime.fromisoformat(item['timestamp']).replace(tzinfo=timezone.utc)
@@ -0,0 +1,59 @@
+import asyncio
+
+
+
+class VoteBatcher:
+    """Collects approved votes for a short window and broadcasts them as one transaction"""
+    def __init__(self, broadcast, window: float=2.0, max_ops: int=10):
+        self.broadcast = broadcast
+        self.window = window
+        self.max_ops = max(int(max_ops), 1)
+        self.pending = []
+        self.timer = None
+        self.sending = set()
+
+
+    async def submit(self, op) -> bool:
+        """Queues a vote op and resolves to whether it made it on chain"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((op, future))
+        if len(self.pending) >= self.max_ops:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+        return await future
+
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+
+    async def _send(self, batch: list) -> None:
+        ops = [op for op, _ in batch]
+        try:
+            if len(ops) == 1:
+                results = [await self.broadcast(ops)]
+            elif await self.broadcast(ops):
+                results = [True] * len(ops)
+            else:
+                # One bad vote rejects the whole transaction, so retry them one by one
+                results = await asyncio.gather(*(self.broadcast([op]) for op in ops), return_exceptions=True)
+        except asyncio.CancelledError:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(False)
+            raise
+        except Exception as e:
+            # A broadcast that blew up still has to answer everyone waiting on it
+            print(e)
+            results = [False] * len(ops)
+        for (_, future), ok in zip(batch, results):
+            if not future.done():
+                future.set_result(ok is True)